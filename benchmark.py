@@ -0,0 +1,269 @@
+"""
+Benchmark stategen.py and i18n/l18n_gen.py against synthetic inputs of different scales.
+
+    python benchmark.py --scale medium --save-baseline bench.json
+    python benchmark.py --scale medium --baseline bench.json   # fails if anything got slower
+
+Every case is timed on its own (best of --repeat runs), then run once more under tracemalloc
+to get its peak memory.
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import yaml
+
+ROOT = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, ROOT)
+import stategen  # noqa: E402
+
+
+def load_l18n_gen():
+    spec = importlib.util.spec_from_file_location('l18n_gen', os.path.join(ROOT, 'i18n', 'l18n_gen.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+l18n_gen = load_l18n_gen()
+
+# (state props, events, locales x keys) per scale
+SCALES = {
+    'small': ([10], [10], [(2, 1000)]),
+    'medium': ([10, 100], [10, 500], [(2, 1000), (10, 10000)]),
+    'large': ([10, 100, 1000], [10, 500, 5000], [(2, 1000), (10, 10000), (60, 50000)]),
+}
+
+PROP_SPECS = [
+    'int count%d=0// counter %d',
+    'String? name%d// name %d (jk@name_%d)',
+    'Map<String, List<int>>? cache%d',
+    'List<String> items%d=const []/// items %d',
+    'DictStatus status%d=DictStatus.init',
+]
+
+
+def props(count):
+    ret = []
+    for i in range(count):
+        spec = PROP_SPECS[i % len(PROP_SPECS)]
+        ret.append(spec % ((i,) * spec.count('%d')))
+    return ret
+
+
+def state_data(count):
+    return {'name': 'BenchState', 'dest': '.s.dart', 'part': 'bench.dart', 'useJson': True, 'props': props(count)}
+
+
+def events(count):
+    ret = {}
+    for i in range(count):
+        if i % 3 == 0:
+            ret['Event%d' % i] = None
+        elif i % 3 == 1:
+            ret['Event%d~event%d' % (i, i)] = props(3)
+        else:
+            ret['.Extra%d~extra%d' % (i, i)] = props(1)
+    return ret
+
+
+def event_data(count):
+    return {'name': 'BenchEvent', 'dest': '.e.dart', 'part': 'bench.dart', 'events': events(count)}
+
+
+def bloc_data():
+    return {'name': 'BenchBloc', 'dest': '.b.dart', 'part': 'bench.dart', 'useHydrate': True,
+            'state_file': 'bench.s.dart', 'event_file': 'bench.e.dart'}
+
+
+def all_data(prop_count, event_count):
+    return {
+        'part': 'bench.dart',
+        'path': 'bench',
+        stategen.T_STATE: {'name': 'BenchState', 'dest': '.s.dart', 'props': props(prop_count)},
+        stategen.T_EVENT: {'name': 'BenchEvent', 'dest': '.e.dart', 'events': events(event_count)},
+        stategen.T_BLOC: {'name': 'BenchBloc', 'dest': '.b.dart', 'useHydrate': False, 'useReplay': True},
+    }
+
+
+def catalog(locales, keys):
+    languages = [{'locale': 'l%d_XX' % i, 'name': 'Lang%d' % i} for i in range(locales)]
+    languages[0]['default'] = True
+    shared = {'AppName': 'Bench', 'Company': ['$@AppName Inc.'] + ['$@AppName %d' % i for i in range(1, locales)]}
+    strings = {}
+    for k in range(keys):
+        group = strings.setdefault('Group%d' % (k // 100), {})
+        if k % 50 == 0:
+            group['Count%d_count' % k] = ['%%s items %d in %d' % (k, i) for i in range(locales)]
+        else:
+            group['Key%d' % k] = ['$@AppName value %d in %d' % (k, i) for i in range(locales)]
+    return {'Languages': languages, 'Shared': shared, 'Strings': strings}
+
+
+def gen(func, data):
+    """run a generator and write what it generated"""
+    session = stategen.Session()
+    func(argparse.Namespace(), data=data, session=session)
+    session.save()
+
+
+def stategen_case(func, data, prepare=None):
+    def run():
+        gen(func, json.loads(data))
+
+    return prepare, run
+
+
+def cases(scale, workdir):
+    """yield (name, setup, run, size) for every case of the scale"""
+    prop_counts, event_counts, catalogs = SCALES[scale]
+    def remove(*names):
+        def prepare():
+            for name in names:
+                if os.path.exists(name):
+                    os.remove(name)
+        return prepare
+
+    for count in prop_counts:
+        yield ('state_gen/%d props' % count,) + stategen_case(stategen.state_gen, json.dumps(state_data(count)),
+                                                               remove('bench.s.dart')) + (count,)
+    for count in event_counts:
+        yield ('event_gen/%d events' % count,) + stategen_case(stategen.event_gen, json.dumps(event_data(count)),
+                                                               remove('bench.e.dart')) + (count,)
+    for count in event_counts:
+        def fresh(count=count):  # bloc_gen needs state and event files, and no bloc file yet
+            gen(stategen.state_gen, state_data(10))
+            gen(stategen.event_gen, event_data(count))
+            if os.path.exists('bench.b.dart'):
+                os.remove('bench.b.dart')
+
+        yield ('bloc_gen/%d events' % count,) + stategen_case(stategen.bloc_gen, json.dumps(bloc_data()),
+                                                              fresh) + (count,)
+
+        def existing(count=count):  # a bloc file missing a tenth of the events, to be merged
+            fresh(max(count - count // 10, 1))
+            gen(stategen.bloc_gen, bloc_data())
+            gen(stategen.event_gen, event_data(count))
+
+        yield ('bloc_gen merge/%d events' % count,) + stategen_case(stategen.bloc_gen, json.dumps(bloc_data()),
+                                                                    existing) + (count,)
+    for props_count, event_count in zip(prop_counts, event_counts):
+        def clean():
+            shutil.rmtree('bench', ignore_errors=True)
+
+        yield ('all_gen/%d props %d events' % (props_count, event_count),) + stategen_case(
+            stategen.all_gen, json.dumps(all_data(props_count, event_count)), clean) + (props_count + event_count,)
+    for locales, keys in catalogs:
+        name = os.path.join(workdir, 'strings_%d_%d.yaml' % (locales, keys))
+        with open(name, 'w') as f:
+            yaml.safe_dump(catalog(locales, keys), f, allow_unicode=True)
+        output = os.path.join(workdir, 'i18n_%d_%d' % (locales, keys))
+        os.makedirs(output, exist_ok=True)
+
+        def run(name=name, output=output, cache_dir=None):
+            l18n_gen.main(name, output, 'S', 'TI', 'R', False, CACHE_DIR=cache_dir, FORCE=True)
+
+        yield 'l18n_gen/%d locales x %d keys' % (locales, keys), None, run, locales * keys
+
+        def cached(run=run, cache_dir=os.path.join(workdir, 'cache')):  # the cached catalog, every file rendered
+            run(cache_dir=cache_dir)
+
+        yield 'l18n_gen cached/%d locales x %d keys' % (locales, keys), cached, cached, locales * keys
+
+
+def quiet(func):
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        func()
+
+
+def measure(setup, run, repeat):
+    best = None
+    for _ in range(repeat):
+        if setup:
+            quiet(setup)
+        start = time.perf_counter()
+        quiet(run)
+        spent = time.perf_counter() - start
+        best = spent if best is None else min(best, spent)
+    if setup:
+        quiet(setup)
+    tracemalloc.start()
+    quiet(run)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+# differences smaller than these are noise, whatever the percentage is
+MIN_DELTA = {'seconds': 0.005, 'peak_kb': 256}
+
+
+def compare(results, baseline, tolerance):
+    """:return: list of regression descriptions"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key, unit in (('seconds', 's'), ('peak_kb', 'KB')):
+            if base[key] and result[key] > base[key] * (1 + tolerance) and \
+                    result[key] - base[key] > MIN_DELTA[key]:
+                regressions.append('%s: %s %.3f%s -> %.3f%s (+%.0f%%)' % (
+                    name, key, base[key], unit, result[key], unit, (result[key] / base[key] - 1) * 100))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the generators with synthetic inputs')
+    parser.add_argument('-s', '--scale', choices=sorted(SCALES), default='small',
+                        help='How big the synthetic inputs are')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='How many times to time each case, the best one is kept')
+    parser.add_argument('-k', '--filter', default='',
+                        help='Only run cases whose name contains this')
+    parser.add_argument('-b', '--baseline',
+                        help='Compare with this baseline JSON, exit 1 if anything regressed')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.25,
+                        help='How much slower/bigger than the baseline is considered a regression')
+    parser.add_argument('--save-baseline',
+                        help='Save the results as baseline JSON')
+    args = parser.parse_args()
+
+    results = {}
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='stategen_bench_')
+    try:
+        os.chdir(workdir)
+        print('%-40s %10s %12s %12s' % ('case', 'seconds', 'peak KB', 'per item us'))
+        for name, setup, run, size in cases(args.scale, workdir):
+            if args.filter not in name:
+                continue
+            seconds, peak = measure(setup, run, args.repeat)
+            results[name] = {'seconds': seconds, 'peak_kb': peak / 1024, 'size': size}
+            print('%-40s %10.4f %12.1f %12.2f' % (name, seconds, peak / 1024, seconds / size * 1e6))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print('\nRegressions against %s:\n%s' % (args.baseline, '\n'.join(regressions)), file=sys.stderr)
+            sys.exit(1)
+        print('\nNo regression against %s' % args.baseline)
+
+
+if __name__ == '__main__':
+    main()
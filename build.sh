@@ -42,33 +42,36 @@ fi
 runner() {
   (
       cd $PROJ_ROOT
-      dart run build_runner build --delete-conflicting-outputs
+      if [ -n "$FORCE" ]; then
+        dart run build_runner build --delete-conflicting-outputs && rm -f "$CHANGED"
+        exit $?
+      fi
+      if [ ! -s "$CHANGED" ]; then
+        echo "Nothing changed for build_runner"
+        exit 0
+      fi
+      FILTERS=""
+      for target in $(sort -u "$CHANGED"); do
+        FILTERS="$FILTERS --build-filter=$target"
+      done
+      dart run build_runner build --delete-conflicting-outputs $FILTERS && rm -f "$CHANGED"
   )
 }
 ROOT_ARG="-R"
+FORCE_ARG="-f"
+FORCE=""
 build(){
   YAML=$(realpath $1)
   if [ ! -r "$YAML" ];then
-    echo "Usage: $0 [ ${ROOT_ARG} project_root ] <YAMLFILE>"
+    echo "Usage: $0 [ ${ROOT_ARG} project_root ] [ ${FORCE_ARG} ] <YAMLFILE>"
     exit 2
   fi
   where=$(dirname $YAML)
   (
     cd $where
-    local MARK="${YAML}.modified"
-    local build=1
-    if [ -f "$MARK" ];then
-      if [ "$YAML" -nt "$MARK" ];then
-        echo "You have changed to $YAML"
-      else
-        echo "$YAML build is still valid"
-        build=0
-      fi
-    fi
+    # stategen.py keeps track of every input of the YAML, it tells if the build is still valid
     local action=all
-    if [ $build -eq 1 ]; then
-      $PYTHON $GENPY $action $YAML && echo -e "Don't change\n$(date)" > $MARK
-    fi
+    $PYTHON $GENPY $action $FORCE --changed_list "$CHANGED" $YAML
   )
 }
 if [ "$1" = "${ROOT_ARG}" ];then
@@ -76,6 +79,15 @@ if [ "$1" = "${ROOT_ARG}" ];then
   PROJ_ROOT=$1
   shift
 fi
+if [ "$1" = "${FORCE_ARG}" ];then
+  shift
+  FORCE="--force"
+fi
+# the .g.dart files whose inputs the generator changed, relative to the project root,
+# they are kept till build_runner regenerates them successfully
+CHANGED="$(cd $PROJ_ROOT && pwd)/.dart_tool"  # resolved like runner's cd, PROJ_ROOT may go through the submodule link
+mkdir -p "$CHANGED"
+CHANGED="$CHANGED/stategen_changed.txt"
 yamls="$@"
 if [ -z "$yamls" ]; then
   yamls=$(ls *.yaml)
@@ -1,6 +1,14 @@
+import contextlib
+import functools
+import glob
+import hashlib
 import json
 import os
+import pickle
 import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from os.path import basename
 from string import Template
 
@@ -9,6 +17,15 @@ import yaml
 ARG_DELI = '_'  # if key has this, means it has argument
 MAP_KEY = 'key'  # if value is a hash, we use this variable to define the argument name
 DEF_DELI = '@' # if args has this deli, we assuming the first part is the variable type
+T_CACHE_DIR = '.stategen'  # where parsed YAML files are cached, next to the YAML
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)  # libyaml's loader is a lot faster when it's there
+PARALLEL_MIN_STRINGS = 20000  # below this many strings, starting worker processes costs more than it saves
+# %s, %1$s, {name}, $name, ${name} and the escaped %, then a ${ of a dart expression and any other $
+PLACEHOLDER = re.compile(r'%%|%(?:(\d+)\$)?[sd]|\{(\w+)\}|\$\{(\w+)\}|\$(\w+)|\$\{|\$')
+T_STRINGS = 'Strings'
+T_SHARED = 'Shared'
+T_INCLUDE = 'Include'  # files or globs of more Strings and Shared, relative to the catalog
+PART_KEYS = (T_STRINGS, T_SHARED)  # what an included file can have
 
 class JavaTemplate(Template):
     delimiter = '%'
@@ -18,6 +35,71 @@ class ShareKeyTemplate(Template):
     delimiter = '$@'
 
 
+class Profiler:
+    """
+    Per phase timings and counters of a run, saved as JSON or as a Chrome trace (chrome://tracing).
+    It does nothing until enabled.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.start = time.perf_counter()
+        self.spans = []  # [name, start, seconds]
+        self.counters = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append([name, start - self.start, time.perf_counter() - start])
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def take(self):
+        """hand over what's been collected so far, used to ship results from worker processes"""
+        ret = {'spans': self.spans, 'counters': self.counters}
+        self.spans, self.counters = [], {}
+        return ret
+
+    def merge(self, collected):
+        self.spans.extend(collected['spans'])
+        for name, n in collected['counters'].items():
+            self.count(name, n)
+
+    def report(self):
+        phases = {}
+        for name, start, seconds in self.spans:
+            phase = phases.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            phase['seconds'] += seconds
+            phase['calls'] += 1
+        return {'seconds': time.perf_counter() - self.start, 'phases': phases, 'counters': self.counters}
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        return {'traceEvents': [
+            {'name': name, 'cat': 'l18n_gen', 'ph': 'X', 'ts': start * 1e6, 'dur': seconds * 1e6,
+             'pid': pid, 'tid': pid}
+            for name, start, seconds in self.spans
+        ] + [
+            {'name': name, 'ph': 'C', 'ts': 0, 'pid': pid, 'args': {name: n}}
+            for name, n in self.counters.items()
+        ]}
+
+    def save(self, path, fmt='json'):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace() if fmt == 'chrome' else self.report(), f, indent=1, sort_keys=True)
+
+
+PROFILE = Profiler()
+
+
 def flatten_json(y):
     out = {}
 
@@ -55,6 +137,74 @@ def generate_interface(name, args=None):
         return "String get %s => '';" % name
 
 
+def arg_names(args):
+    return [arg.split(DEF_DELI)[-1] for arg in args]
+
+
+def compile_placeholders(value, names, used=None):
+    """
+    turn the %s, %1$s, {name}, $name and ${name} placeholders of a string into dart interpolation of the
+    arguments, %s take the arguments in order. A ${ of a dart expression is kept, any other $ of the text is escaped
+    :param names: argument names
+    :param used: set collecting the arguments interpolated
+    """
+    order = iter(range(len(names)))
+
+    def replace(m):
+        text = m.group(0)
+        if text == '%%':
+            return '%'
+        if text == '${':  # a dart expression
+            return text
+        if text == '$':
+            return r'\$'
+        if m.group(2) or m.group(3) or m.group(4):
+            name = m.group(2) or m.group(3) or m.group(4)
+            if name not in names:  # {word} is text, ${word} an expression, $word a $ followed by text
+                return r'\%s' % text if m.group(4) else text
+        else:
+            i = int(m.group(1)) - 1 if m.group(1) else next(order, len(names))
+            if not 0 <= i < len(names):
+                raise GenError('"%s" has more placeholders than its arguments: %s' % (value, ", ".join(names)))
+            name = names[i]
+        if used is not None:
+            used.add(name)
+        return '${%s}' % name
+
+    return PLACEHOLDER.sub(replace, value)
+
+
+def used_args(value, names):
+    """:return: the arguments the placeholders of a string use"""
+    used = set()
+    compile_placeholders(value, names, used)
+    return used
+
+
+def check_placeholders(names, result, keys):
+    """
+    :return: warnings about the strings whose languages don't use the same arguments
+    :raise GenError: if a string has more placeholders than arguments
+    """
+    warnings = []
+    for k in keys:
+        args = split_key(k)[1]
+        if not args:
+            continue
+        args = arg_names(args)
+        used = {}
+        for name, strings in zip(names, result):
+            if isinstance(strings[k], str):
+                try:
+                    used[name] = used_args(strings[k], args)
+                except GenError as e:
+                    raise GenError("%s in %s: %s" % (k, name, e))
+        if len(set(map(frozenset, used.values()))) > 1:
+            warnings.append("Warning: %s doesn't use the same arguments in every language, %s" % (k, "; ".join([
+                "%s uses %s" % (name, ", ".join(sorted(u)) or "none") for name, u in used.items()])))
+    return warnings
+
+
 def generate_override(name, value, args=None):  # value can be a dictionary
     if not args:
         return '@override String get %s => "%s";' % (name, value)
@@ -69,7 +219,7 @@ def generate_override(name, value, args=None):  # value can be a dictionary
                                                               for k, v in value.items()]))
         value = "%s[%s] ?? ''" % (map_name, args[0])
     else:
-        value = '"%s"' % (repr(value.replace('"', r'\"'))[1:-1])
+        value = '"%s"' % compile_placeholders(repr(value.replace('"', r'\"'))[1:-1], arg_names(args))
 
     return ('''
     @override
@@ -79,13 +229,240 @@ def generate_override(name, value, args=None):  # value can be a dictionary
 ''') % (name, argname, extra, value)
 
 
+def content_hash(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+def split_key(key):
+    """:return: method name and its arguments of a string key"""
+    first, *rest = key.split(ARG_DELI)
+    return first, [a for a in rest if a]  # filter out all empty string
+
+
+def generate_locale(template, name, strings, keys, mapping):
+    """
+    render the class of one language, it's executed in a worker process when there are many strings
+    :param template: CLS_TEMPLATE's template string
+    :param strings: {key: string} of the language
+    :param keys: sorted keys to generate
+    """
+    PROFILE.count('strings generated', len(keys))
+    code = []
+    for k in keys:
+        first, rest = split_key(k)
+        code.append(generate_override(first, strings[k], rest))
+    return JavaTemplate(template).safe_substitute(dict(mapping, code="\n".join(code), cls=name))
+
+
+def generate_table(template, name, strings, keys, mapping):
+    """
+    the packed version of generate_locale(): the strings of one language as a JSON list, in the order of keys
+    """
+    PROFILE.count('strings generated', len(keys))
+    table = []
+    for k in keys:
+        value, args = strings[k], split_key(k)[1]
+        table.append(compile_placeholders(value, arg_names(args)) if args and isinstance(value, str) else value)
+    return json.dumps(table, ensure_ascii=False, separators=(',', ':'))
+
+
+def locale_init(profile):
+    """initializer of the locale worker processes"""
+    PROFILE.enabled = profile
+    PROFILE.take()  # a forked worker starts with what the main process collected so far, it's counted there
+
+
+def locale_job(packed, *task):
+    """
+    generate_locale() or generate_table() in a worker process
+    :return: the content and what the worker profiled, to be merged into the main process' profile
+    """
+    content = (generate_table if packed else generate_locale)(*task)
+    return content, PROFILE.take()
+
+
+def generate_accessor(name, index, value, args=None):
+    """the interface method of a packed string, reading it from the string table by index"""
+    if not args:
+        return 'String get %s => _s(%d);' % (name, index)
+    if isinstance(value, dict):
+        return 'String %s(%s) => _m(%d, %s);' % (name, get_args(args), index, args[0].split(DEF_DELI)[-1])
+    return 'String %s(%s) => _f(%d, {%s});' % (name, get_args(args), index, ", ".join(
+        ["'%s': %s" % ((arg.split(DEF_DELI)[-1],) * 2) for arg in args]))
+
+
+def asset_key(path, root):
+    """:return: the key the app loads the asset at path with, relative to the flutter project of path"""
+    folder = os.path.dirname(path)
+    while not os.path.isfile(os.path.join(folder, 'pubspec.yaml')):
+        parent = os.path.dirname(folder)
+        if parent == folder:  # not in a flutter project
+            folder = root
+            break
+        folder = parent
+    return os.path.relpath(path, folder).replace(os.sep, '/')
+
+
 def shift_arg(name, key):
     global ARG_DELI
     deli = ARG_DELI
     return re.sub(r'^([^%s]+)(.*)$' % deli, r'\1%s%s\2' % (deli, key), name)
 
 
-def main(
+class GenError(Exception):
+    pass
+
+
+def resolve_shared(shared, count):
+    """
+    Expand the $@Key references between shared keys, whatever order they are declared in
+    :param shared: {key: value or [value of every language]}
+    :param count: how many languages
+    :return: [{key: expanded value}] of every language
+    """
+    raw = [{} for i in range(count)]
+    for sk, sv in shared.items():
+        if not isinstance(sv, list):
+            sv = [sv] * count
+        if len(sv) > count:
+            raise GenError("Shared key %s has too many values, expected no more than %d" % (sk, count))
+        for i, v in enumerate(sv):
+            raw[i][sk] = str(v)
+
+    ret = []
+    for values in raw:
+        resolved = {}
+        resolving = []  # keys being expanded, in order, a key showing up again is a cycle
+
+        def resolve(key):
+            if key in resolved:
+                return resolved[key]
+            if key in resolving:
+                cycle = resolving[resolving.index(key):] + [key]
+                raise GenError("Shared keys reference each other: %s" % " -> ".join(cycle))
+            value = values[key]
+            if '$@' in value:
+                resolving.append(key)
+                refs = {}
+                for m in ShareKeyTemplate.pattern.finditer(value):
+                    ref = m.group('named') or m.group('braced')
+                    if ref in values:
+                        refs[ref] = resolve(ref)
+                resolving.pop()
+                value = ShareKeyTemplate(value).safe_substitute(refs)
+            resolved[key] = value
+            return value
+
+        for key in values:
+            resolve(key)
+        ret.append({key: resolved[key] for key in values})
+    return ret
+
+
+def normalize(obj):
+    """
+    Resolve a parsed strings YAML into what the dart files are generated from: the languages, the settings
+    and {key: string} of every language, with the keys flattened and the shared keys expanded
+    """
+    T_SETTINGS = 'settings'  # YAML has settings can override
+    sharedPrefix = 'Shared'
+    language = obj.get('Languages', None)
+    strings = obj.get('Strings', None)
+    shared = obj.get(sharedPrefix, None)  # shared keywords
+    if not language:
+        raise GenError("Missing language definition")
+
+
+    T_NAME = 'name'
+    T_LOCALE = 'locale'
+    T_ALIAS = 'alias'
+    T_DEFAULT = 'default'
+
+    result = []
+    names = []
+    locales = {}  # locales to name map
+    aliases = {}
+    default_locale = ''
+    for value in language:
+        result.append({})
+        name = value[T_NAME]
+        alias = value.get(T_ALIAS, None)
+        locale = value.get(T_LOCALE, None)
+        default = value.get(T_DEFAULT, None)
+        names.append(name)
+        if locale:
+            locales[name] = locale
+            if not default_locale and default:
+                default_locale = locale
+            if alias:
+                if alias is not list:
+                    alias = [alias]
+                for a in alias:
+                    aliases[a] = locale
+    if not default_locale:  # default to the first one
+        default_locale = locales.get(names[0], '')
+
+    sharedKeys = [{} for i in range(len(language))]
+
+    def convertShared(value, i):
+        if '$@' not in value:
+            return value
+        return ShareKeyTemplate(value).safe_substitute(sharedKeys[i])
+
+    if shared:
+        with PROFILE.phase('shared expansion'):
+            sharedKeys = resolve_shared(shared, len(language))
+
+    if strings:
+
+        nl = len(names)
+        with PROFILE.phase('flatten'):
+            strings = flatten_json(strings)
+        with PROFILE.phase('shared expansion'):
+            for key, value in strings.items():
+                key = re.sub(r'\s', '', key)
+                i = 0
+                if not isinstance(value, list):  # same value cross different languages
+                    value = [value] * nl
+                if len(value) > nl:
+                    raise GenError("For your key: %s has too many values to pack, expected less than %s"
+                                   % (key, len(language)))
+                if len(value) < nl:
+                    for j in range(len(value),
+                                   nl):  # if not enough list, use the first one repetitively
+                        value.append(value[0])
+                needConversion = False
+                new_key = key
+                for v in value:
+                    if isinstance(v, dict):
+                        needConversion = True
+                        v = json.dumps(v)
+                    sv = str(v)
+                    sv = convertShared(sv, i)
+                    if needConversion:
+                        sv = json.loads(sv)
+                        new_key = shift_arg(key, MAP_KEY)
+                    result[i][new_key] = sv
+                    i += 1
+                if i != nl:
+                    raise GenError("%s has less value than %d" % (key, nl))
+        i = 0
+        for keys in sharedKeys:
+            result[i].update({"%s%s" % (sharedPrefix, k): v for k, v in keys.items()})
+            i += 1
+    return {
+        'settings': obj.get(T_SETTINGS, {}),
+        'names': names,
+        'locales': locales,
+        'aliases': aliases,
+        'default_locale': default_locale,
+        'strings': result if strings else None,
+        'extra': obj.get('extra', ''),
+    }
+
+
+def render(
+        catalog,
         YAMLFILE,
         OUTPUTDIR,
         HELPER_NAME,
@@ -93,35 +470,62 @@ def main(
         DEFAULT_OBJ,
         INTERFACE_ONLY,
         ARGS="",
+        JOBS=1,
+        MANIFEST=None,
+        CACHED=False,
+        DEFERRED=False,
+        PACKED=False,
+        DIAGNOSTICS=None,
 ):
-    obj = yaml.safe_load(open(YAMLFILE))
-    T_SETTINGS = 'settings'  # YAML has settings can override
-    settings = obj.get(T_SETTINGS, {})
+    """
+    Generate the dart files in memory, without touching the disk or the working directory
+    :param catalog: what normalize() returns for YAMLFILE
+    :param OUTPUTDIR: where the files go, relative to YAMLFILE
+    :param JOBS: how many worker processes to generate the language classes with
+    :param MANIFEST: content hashes the last render left in it, only the language classes whose strings changed
+        are generated, and the interface and helper only when the keys, languages or settings changed.
+        It's updated for the next render
+    :param CACHED: generate a helper that creates every language instance once and resolves locales from
+        precomputed tables, instead of creating an instance every time a string is read
+    :param DEFERRED: generate every language as a library of its own, imported deferred by the helper except
+        the default one, so a language is only loaded when the delegate loads its locale
+    :param PACKED: save the strings of every language as a JSON asset instead of a class, read by the interface
+        by index once the delegate loaded it
+    :param DIAGNOSTICS: list the warnings of the render are added to
+    :return: {path: content}
+    """
+    outputs = {}
+    manifest = MANIFEST if MANIFEST is not None else {}
+    diagnostics = DIAGNOSTICS if DIAGNOSTICS is not None else []
+    settings = catalog['settings']
 
     l18n = settings.get("l18n", "l18n")  # give user to override in YAML file
     HELPER_NAME = settings.get("helper", HELPER_NAME)
     DEFAULT_CLS = settings.get("default_class", DEFAULT_CLS)
     DEFAULT_OBJ = settings.get("default_object", DEFAULT_OBJ)
     delegate = settings.get("delegate", "TRLocalizationDelegate")
+    CACHED = settings.get("cached", CACHED)
+    DEFERRED = settings.get("deferred", DEFERRED)
+    PACKED = settings.get("packed", PACKED)
 
     EXT = ".dart"
     DEFAULT_PKG = HELPER_NAME + EXT
 
     script_dir, script = os.path.split(__file__)
     yaml_full = os.path.realpath(YAMLFILE)  # get the relative path
-    os.chdir(os.path.dirname(yaml_full))
+    OUTPUTDIR = os.path.join(os.path.dirname(yaml_full), OUTPUTDIR)
     NOTES = "/// generated content don't modify it manually, modify %s instead\n///Via: %s %s\n" % (
         YAMLFILE, script, ARGS)
 
     DEFAULT_TEMPLATE = JavaTemplate(NOTES + '''
-    part of '%package';
+    %library
     class %interface {
       %code
       static %interface instance() => %interface();
     }
     ''')
     CLS_TEMPLATE = JavaTemplate(NOTES + '''
-    part of '%package';
+    %library
     
     class %cls extends %interface {
        %code
@@ -142,7 +546,7 @@ def main(
     %parts;
     '''
 
-    HELPER = SIMPLEHELPER + '''
+    HELPER_CLS = '''
     
     class %cls {
      static const map = {
@@ -189,10 +593,12 @@ def main(
       }
     }
     %interface %default_obj = %cls.%default_obj;
-    
+    '''
+    DELEGATE = '''
     class %delegate extends LocalizationsDelegate<%interface> {
       const %delegate();
-    
+    '''
+    SUPPORTED = '''
       List<Locale> get supportedLocales {
         return %cls.map.keys.map(
             (name) { 
@@ -201,15 +607,17 @@ def main(
               return Locale.fromSubtags(languageCode: code[0], countryCode: cc);
             }
         ).toList();
-      }
-      
-      @override
-      bool isSupported(Locale locale) => _isSupported(locale);
+      }'''
+    LOAD = '''
       @override
       Future<%interface> load(Locale locale) {
         %cls.currentLocale = locale;
        return  Future.value(%cls.%default_obj);
-      }
+      }'''
+    DELEGATE_END = '''
+      
+      @override
+      bool isSupported(Locale locale) => _isSupported(locale);%load
       @override 
       bool shouldReload(TRLocalizationDelegate old) => false;
     
@@ -222,80 +630,274 @@ def main(
     }
     
     '''
+    HELPER = SIMPLEHELPER + HELPER_CLS + DELEGATE + SUPPORTED + JavaTemplate(DELEGATE_END).safe_substitute(load=LOAD)
 
+    # every language instance is created once, the locale is resolved from tables computed here
+    CACHED_CLS = '''
+    
+    class %cls {
+     static const map = {
+       // locale to instance map
+       %code
+     };
+    
+     // alias map
+     static const aliases = %alias;
+     // default locale 
+     static const defaultLocale = Locale(%defaultLocale);
+     // locale, alias and language code to the locale of the language, in that order
+     static const resolution = <String, String>{%resolution};
+     static const locales = <Locale>[%locales];
+    
+     static final _instances = <String, %interface>{};
+     static %interface? _current;
+     static Locale? _currentLocale;
+     static Locale? get currentLocale => _currentLocale;
+     static set currentLocale(Locale? locale) {
+       if (locale != _currentLocale) {
+         _currentLocale = locale;
+         _current = null;
+       }
+     }
+      static String? resolve(Locale locale) =>
+          resolution[locale.toString()] ?? resolution[locale.languageCode];
+      static dynamic supportedLocale(Locale locale){
+        final name = resolve(locale);
+        return name == null ? null : map[name];
+      }
+      static %interface instanceOf(String name) => _instances[name] ??= map[name]!() as %interface;
+      static %interface get %default_obj => _current ??= _load();
+      static %interface _load() {
+        if (_currentLocale == null) {
+          String locale = '';
+          if (kIsWeb){
+            locale = ui.window.locale.toLanguageTag();
+          }else {
+            locale = Platform.localeName;
+          }
+          final PL = locale.replaceAll(r'\.*$',"").split('_');
+          _currentLocale = Locale(PL[0],PL.length > 1 ? PL[1] : null) ;
+        }
+        return instanceOf(resolve(_currentLocale!) ?? '%defaultName');
+      }
+    }
+    %interface %default_obj = %cls.%default_obj;
+    '''
+    CACHED_SUPPORTED = '''
+      List<Locale> get supportedLocales => %cls.locales;'''
+    CACHED_HELPER = SIMPLEHELPER + CACHED_CLS + DELEGATE + CACHED_SUPPORTED + \
+        JavaTemplate(DELEGATE_END).safe_substitute(load=LOAD)
 
-    sharedPrefix = 'Shared'
-    language = obj.get('Languages', None)
-    strings = obj.get('Strings', None)
-    shared = obj.get(sharedPrefix, None)  # shared keywords
-    if not language:
-        print("Missing language definition")
-        sys.exit(-1)
+    # every language is a library of its own, only the default one is loaded with the app, the others
+    # when the delegate loads them
+    DEFERRED_CLS = '''
+    
+    class %cls {
+     // default locale 
+     static const defaultLocale = Locale(%defaultLocale);
+     // locale, alias and language code to the locale of the language, in that order
+     static const resolution = <String, String>{%resolution};
+     static const locales = <Locale>[%locales];
+     // locale to the loader of its library
+     static final _loaders = <String, Future<%interface> Function()>{
+       %loaders
+     };
+    
+     static final _instances = <String, %interface>{'%defaultName': %defaultCls.instance()};
+     static %interface? _current;
+     static Locale? _currentLocale;
+     static Locale? get currentLocale => _currentLocale;
+     static set currentLocale(Locale? locale) {
+       if (locale != _currentLocale) {
+         _currentLocale = locale;
+         _current = null;
+       }
+     }
+      static String? resolve(Locale locale) =>
+          resolution[locale.toString()] ?? resolution[locale.languageCode];
+      static dynamic supportedLocale(Locale locale) => resolve(locale);
+      static Future<%interface> loadLocale(Locale locale) async {
+        final name = resolve(locale) ?? '%defaultName';
+        final found = _instances[name] ??= await _loaders[name]!();
+        currentLocale = locale;
+        return _current = found;
+      }
+      // strings come from the default language until loadLocale() loaded the current one
+      static %interface get %default_obj {
+        if (_current == null) {
+          if (_currentLocale == null) {
+            String locale = '';
+            if (kIsWeb){
+              locale = ui.window.locale.toLanguageTag();
+            }else {
+              locale = Platform.localeName;
+            }
+            final PL = locale.replaceAll(r'\.*$',"").split('_');
+            _currentLocale = Locale(PL[0],PL.length > 1 ? PL[1] : null) ;
+          }
+          final found = _instances[resolve(_currentLocale!)];
+          if (found == null) {
+            return _instances['%defaultName']!;
+          }
+          _current = found;
+        }
+        return _current!;
+      }
+    }
+    %interface %default_obj = %cls.%default_obj;
+    '''
+    DEFERRED_LOAD = '''
+      @override
+      Future<%interface> load(Locale locale) => %cls.loadLocale(locale);'''
+    DEFERRED_HELPER = SIMPLEHELPER + DEFERRED_CLS + DELEGATE + CACHED_SUPPORTED + \
+        JavaTemplate(DELEGATE_END).safe_substitute(load=DEFERRED_LOAD)
 
+    # the strings of every language are a JSON list asset, read by the interface by index
+    PACKED_TEMPLATE = JavaTemplate(NOTES + '''
+    %library
+    class %interface {
+      %interface([this._table = const []]);
+      final List<dynamic> _table;
+      static final _arg = RegExp(r'\\\\\\$|\\$\\{(\\w+)\\}|\\$(\\w+)');
+      dynamic _v(int i) => i < _table.length ? _table[i] : null;
+      String _s(int i) => _v(i) as String? ?? '';
+      String _m(int i, Object? key) => (_v(i) as Map?)?[key] as String? ?? '';
+      String _f(int i, Map<String, Object?> args) => _s(i).replaceAllMapped(_arg, (m) {
+        final name = m[1] ?? m[2];
+        if (name == null) return r'$';  // a $ of the text, escaped as \\$
+        return args.containsKey(name) ? '${args[name]}' : m[0]!;
+      });
+      %code
+      static %interface instance() => %interface();
+    }
+    ''')
+    PACKED_CLS = '''
+    
+    class %cls {
+     // default locale 
+     static const defaultLocale = Locale(%defaultLocale);
+     // locale, alias and language code to the locale of the language, in that order
+     static const resolution = <String, String>{%resolution};
+     static const locales = <Locale>[%locales];
+     // locale to the string table asset of the language
+     static const assets = <String, String>{%assets};
+    
+     static final _instances = <String, %interface>{};
+     static final _empty = %interface();
+     static %interface? _current;
+     static Locale? _currentLocale;
+     static Locale? get currentLocale => _currentLocale;
+     static set currentLocale(Locale? locale) {
+       if (locale != _currentLocale) {
+         _currentLocale = locale;
+         _current = null;
+       }
+     }
+      static String? resolve(Locale locale) =>
+          resolution[locale.toString()] ?? resolution[locale.languageCode];
+      static dynamic supportedLocale(Locale locale) => resolve(locale);
+      static Future<%interface> loadLocale(Locale locale) async {
+        final name = resolve(locale) ?? '%defaultName';
+        var found = _instances[name];
+        if (found == null) {
+          final table = jsonDecode(await rootBundle.loadString(assets[name]!)) as List<dynamic>;
+          found = _instances[name] = %interface(table);
+        }
+        currentLocale = locale;
+        return _current = found;
+      }
+      // strings are empty until loadLocale() loaded the string table of a language
+      static %interface get %default_obj => _current ?? _empty;
+    }
+    %interface %default_obj = %cls.%default_obj;
+    '''
+    PACKED_HELPER = SIMPLEHELPER + PACKED_CLS + DELEGATE + CACHED_SUPPORTED + \
+        JavaTemplate(DELEGATE_END).safe_substitute(load=DEFERRED_LOAD)
 
-    T_NAME = 'name'
-    T_LOCALE = 'locale'
-    T_ALIAS = 'alias'
-    T_DEFAULT = 'default'
 
-    result = []
-    names = []
-    locales = {}  # locales to name map
-    aliases = {}
-    default_locale = ''
-    for value in language:
-        result.append({})
-        name = value[T_NAME]
-        alias = value.get(T_ALIAS, None)
-        locale = value.get(T_LOCALE, None)
-        default = value.get(T_DEFAULT, None)
-        names.append(name)
-        if locale:
-            locales[name] = locale
-            if not default_locale and default:
-                default_locale = locale
-            if alias:
-                if alias is not list:
-                    alias = [alias]
-                for a in alias:
-                    aliases[a] = locale
-    if not default_locale:  # default to the first one
-        default_locale = locales.get(names[0], '')
+    names = catalog['names']
+    locales = catalog['locales']
+    default_locale = catalog['default_locale']
 
-    def generate(names, result, alias, locales, default_locale, extra="", interface_only=False):
-        code = {
+    def write(name, content):
+        outputs[os.path.normpath(name)] = content
 
-        }
+    def generate(names, result, alias, locales, default_locale, extra="", interface_only=False):
         keys = sorted(result[0].keys())
-        for k in keys:
-            first, *rest = k.split(ARG_DELI)
-            rest = list(filter(lambda a: a, rest))  # filter out all empty string
-            code.setdefault(DEFAULT_CLS, []).append(generate_interface(first, rest))
-            j = 0
-            for name in names:
-                code.setdefault(name, []).append(generate_override(first, result[j][k], rest))
-                j += 1
-        template = {
-            DEFAULT_CLS: DEFAULT_TEMPLATE
-        }
-        for k, v in code.items():
-            temp = template.get(k, CLS_TEMPLATE)
-            with open(os.path.join(OUTPUTDIR, "%s%s" % (k, EXT)), "w") as f:
-                f.write(
-                    temp.safe_substitute(dict(
-                        package=DEFAULT_PKG,
-                        interface=DEFAULT_CLS,
-                        code="\n".join(v),
-                        cls=k
-                    ))
-                )
-        template_str = HELPER
+        PROFILE.count('keys', len(keys))
+        PROFILE.count('locales', len(names))
+        library = "import '%s%s';" % (DEFAULT_CLS, EXT) if DEFERRED and not PACKED else \
+            "part of '%s';" % DEFAULT_PKG
+        mapping = dict(package=DEFAULT_PKG, interface=DEFAULT_CLS, library=library)
+        with PROFILE.phase('hashing'):
+            # everything but the strings themselves, the interface and helper only depend on these
+            shape = content_hash([keys, names, locales, alias, default_locale, extra, interface_only, NOTES,
+                                  OUTPUTDIR, HELPER_NAME, DEFAULT_CLS, DEFAULT_OBJ, l18n, delegate, CACHED,
+                                  DEFERRED, PACKED, settings.get("asset_dir")])
+            hashes = [content_hash(strings) for strings in result]
+            key_hashes = {k: content_hash([strings[k] for strings in result]) for k in keys}
+        same_shape = manifest.get('shape') == shape
+        last = manifest.get('locales', {})
+        todo = [j for j, name in enumerate(names) if not same_shape or last.get(name) != hashes[j]]
+        manifest.update(shape=shape, locales=dict(zip(names, hashes)), keys=key_hashes)
+        PROFILE.count('locales generated', len(todo))
+        with PROFILE.phase('placeholders'):
+            diagnostics.extend(check_placeholders(names, result, keys))
+        if not same_shape:
+            with PROFILE.phase('render'):
+                if PACKED:
+                    code = [generate_accessor(*split_key(k)[:1], i, result[0][k], split_key(k)[1])
+                            for i, k in enumerate(keys)]
+                    content = PACKED_TEMPLATE.safe_substitute(dict(mapping, code="\n".join(code)))
+                else:
+                    code = [generate_interface(*split_key(k)) for k in keys]
+                    content = DEFAULT_TEMPLATE.safe_substitute(dict(mapping, code="\n".join(code), cls=DEFAULT_CLS,
+                                                                    library="" if DEFERRED else library))
+            write(os.path.join(OUTPUTDIR, "%s%s" % (DEFAULT_CLS, EXT)), content)
+        todo_names = [names[j] for j in todo]
+        jobs = min(JOBS, len(todo)) if len(keys) * len(todo) >= PARALLEL_MIN_STRINGS else 1
+        tasks = [[CLS_TEMPLATE.template] * len(todo), todo_names, [result[j] for j in todo], [keys] * len(todo),
+                 [mapping] * len(todo)]
+        with PROFILE.phase('render'):
+            if jobs > 1:  # languages are independent, map keeps them in order so the output is the same
+                with ProcessPoolExecutor(max_workers=jobs, initializer=locale_init,
+                                         initargs=(PROFILE.enabled,)) as pool:
+                    contents = []
+                    for content, profile in pool.map(functools.partial(locale_job, PACKED), *tasks):
+                        contents.append(content)
+                        PROFILE.merge(profile)
+            else:
+                contents = list(map(generate_table if PACKED else generate_locale, *tasks))
+        for name, content in zip(todo_names, contents):
+            write(os.path.join(OUTPUTDIR, "%s%s" % (name, ".json" if PACKED else EXT)), content)
+        if same_shape:
+            return
+        template_str = PACKED_HELPER if PACKED else DEFERRED_HELPER if DEFERRED else \
+            CACHED_HELPER if CACHED else HELPER
         if interface_only:
             template_str = SIMPLEHELPER
 
+        names_locales = [locales.get(k, k) for k in names]
+        resolution = dict(zip(names_locales, names_locales))
+        for a, locale in alias.items():
+            resolution.setdefault(a, locale)
+        for locale in names_locales:
+            resolution.setdefault(locale.split("_")[0], locale)
+        default_name = "_".join(default_locale)
+        asset_dir = settings.get("asset_dir", "").rstrip("/")  # where the app loads packed tables from
+        default_cls = names[names_locales.index(default_name)] if default_name in names_locales else names[0]
+        if PACKED:
+            parts = ["import 'dart:convert'", "import 'package:flutter/services.dart' show rootBundle",
+                     "part '%s%s'" % (DEFAULT_CLS, EXT)]
+        elif DEFERRED:  # the interface is exported, so the helper is still the only import the app needs
+            parts = ["import '%s%s'" % (DEFAULT_CLS, EXT), "export '%s%s'" % (DEFAULT_CLS, EXT)] + [
+                "import '%s%s'" % (n, EXT) if n == default_cls else "import '%s%s' deferred as lib%s" % (n, EXT, n)
+                for n in names]
+        else:
+            parts = ["part '%s%s'" % (n, EXT) for n in names + [DEFAULT_CLS]]
 
-        with open(os.path.join(OUTPUTDIR, "%s%s" % (HELPER_NAME, EXT)), "w") as f:
-            f.write(
+        with PROFILE.phase('render'):
+            content = (
                 JavaTemplate(template_str).safe_substitute(
                     dict(
                         extra=extra or "",
@@ -306,75 +908,362 @@ def main(
                         ]),
                         cls=HELPER_NAME,
                         default_obj=DEFAULT_OBJ,
-                        parts=";\n".join(
-                            ["part '%s%s'" % (n, EXT) for n in names + [DEFAULT_CLS]]
-                        ),
+                        parts=";\n".join(parts),
                         # if there are different locale string pointing to same translation. for instance: zh_HK and zh_TW
                         alias=alias,
                         # set the default locale
                         defaultLocale=",".join(["'%s'" % locale for locale in default_locale]),
                         l18n=l18n,
-                        delegate=delegate
+                        delegate=delegate,
+                        resolution=", ".join(["'%s': '%s'" % item for item in resolution.items()]),
+                        locales=", ".join(["Locale(%s)" % ", ".join(["'%s'" % part for part in locale.split("_")])
+                                           for locale in names_locales]),
+                        defaultName=default_name,
+                        defaultCls=default_cls,
+                        assets=", ".join([
+                            "'%s': '%s'" % (locale, "%s/%s.json" % (asset_dir, n) if asset_dir else asset_key(
+                                os.path.join(OUTPUTDIR, n + ".json"), os.path.dirname(yaml_full)))
+                            for n, locale in zip(names, names_locales)
+                        ]),
+                        loaders=",\n".join([
+                            "'%s': () => lib%s.loadLibrary().then((_) => lib%s.%s.instance())" % (
+                                locale, n, n, n) for n, locale in zip(names, names_locales) if n != default_cls
+                        ]),
                     )
                 )
             )
+        write(os.path.join(OUTPUTDIR, "%s%s" % (HELPER_NAME, EXT)), content)
 
-    sharedKeys = [{} for i in range(len(language))]
+    if catalog['strings'] is not None:
+        generate(names, catalog['strings'], catalog['aliases'], locales, default_locale.split("_"),
+                 interface_only=INTERFACE_ONLY,
+                 extra=catalog['extra'])
+    return outputs
 
-    def convertShared(value, i):
-        return ShareKeyTemplate(value).safe_substitute(**sharedKeys[i])
 
-    if shared:
-        for sk, sv in shared.items():
-            if not isinstance(sv, list):
-                sv = [sv] * len(language)
-            i = 0
-            for v in sv:
-                cv = convertShared(v, i)
-                sharedKeys[i][sk] = cv
-                i += 1
+def build(
+        obj,
+        YAMLFILE,
+        OUTPUTDIR,
+        HELPER_NAME,
+        DEFAULT_CLS,
+        DEFAULT_OBJ,
+        INTERFACE_ONLY,
+        ARGS="",
+        JOBS=1,
+        MANIFEST=None,
+        CACHED=False,
+        DEFERRED=False,
+        PACKED=False,
+        DIAGNOSTICS=None,
+):
+    """
+    Generate the dart files of a parsed strings YAML in memory
+    :return: {path: content}
+    """
+    return render(normalize(obj), YAMLFILE, OUTPUTDIR, HELPER_NAME, DEFAULT_CLS, DEFAULT_OBJ, INTERFACE_ONLY,
+                  ARGS, JOBS, MANIFEST, CACHED, DEFERRED, PACKED, DIAGNOSTICS)
 
-    if strings:
 
-        nl = len(names)
-        strings = flatten_json(strings)
-        for key, value in strings.items():
-            key = re.sub(r'\s', '', key)
-            i = 0
-            if not isinstance(value, list):  # same value cross different languages
-                value = [value] * nl
-            if len(value) < nl:
-                for j in range(len(value),
-                               nl):  # if not enough list, use the first one repetitively
-                    value.append(value[0])
-            needConversion = False
-            new_key = key
-            for v in value:
-                if isinstance(v, dict):
-                    needConversion = True
-                    v = json.dumps(v)
-                sv = str(v)
-                #  sv = ShareKeyTemplate(sv).safe_substitute(**sharedKeys[i])
-                try:
-                    sv = convertShared(sv, i)
-                except IndexError as e:
-                    print("For your key: %s has too many values to pack, expected less than %s"
-                          % (key, len(language)), file=sys.stderr)
-                    raise e
-                if needConversion:
-                    sv = json.loads(sv)
-                    new_key = shift_arg(key, MAP_KEY)
-                result[i][new_key] = sv
-                i += 1
-            if i != nl:
-                raise "%s has less value than %d" % (key, nl)
-        i = 0
-        for keys in sharedKeys:
-            result[i].update({"%s%s" % (sharedPrefix, k): v for k, v in keys.items()})
-            i += 1
-        generate(names, result, aliases, locales, default_locale.split("_"),
-                 interface_only=INTERFACE_ONLY,
-                 extra=obj.get('extra', ''))
+def file_hash(name):
+    with open(name, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+GEN_VERSION = file_hash(os.path.realpath(__file__))  # a cached catalog is only good for the same generator
+
+
+def read_cache(cache, digest):
+    """:return: what's pickled in cache for the content hash digest, None if it's not there or out of date"""
+    if not cache or not os.path.isfile(cache):
+        return None
+    try:
+        with open(cache, 'rb') as f:
+            cached = pickle.load(f)
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError):
+        return None  # parse it again
+    if cached.get('hash') != digest or cached.get('version') != GEN_VERSION:
+        return None
+    return cached
+
+
+def write_cache(cache, cached):
+    os.makedirs(os.path.dirname(cache), exist_ok=True)
+    tmp = '%s.%d' % (cache, os.getpid())
+    with open(tmp, 'wb') as f:
+        pickle.dump(dict(cached, version=GEN_VERSION), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, cache)
+
+
+def cache_file(cache_dir, yaml_file, ext):
+    return cache_dir and os.path.join(cache_dir, '%s.%s' % (hashlib.sha1(
+        os.path.realpath(yaml_file).encode()).hexdigest(), ext))
+
+
+def include_files(yaml_file, include):
+    """
+    :param include: the Include of a catalog, files or globs relative to it
+    :return: the files it includes, in order
+    """
+    if isinstance(include, str):
+        include = [include]
+    folder = os.path.dirname(yaml_file)
+    ret = []
+    for pattern in include or []:
+        path = os.path.join(folder, pattern)
+        if glob.has_magic(path):
+            matches = sorted(glob.glob(path, recursive=True))
+        elif os.path.isfile(path):
+            matches = [path]
+        else:
+            raise GenError("%s includes %s, which doesn't exist" % (yaml_file, pattern))
+        for name in matches:
+            if name not in ret and os.path.realpath(name) != os.path.realpath(yaml_file):
+                ret.append(name)
+    return ret
+
+
+def load_part(yaml_file, cache_dir=None):
+    """
+    parse an included catalog file and flatten its strings, cached under cache_dir by its content hash
+    :return: content hash, {'Strings': flattened strings, 'Shared': shared keys}
+    """
+    with open(yaml_file, 'rb') as f:
+        raw = f.read()
+    digest = hashlib.sha1(raw).hexdigest()
+    cache = cache_file(cache_dir, yaml_file, 'part.pickle')
+    cached = read_cache(cache, digest)
+    if cached is not None:
+        PROFILE.count('cache hits')
+        return digest, cached['part']
+    with PROFILE.phase('yaml load'):
+        obj = yaml.load(raw, Loader=YAML_LOADER) or {}
+    unknown = [k for k in obj if k not in PART_KEYS]
+    if unknown:
+        raise GenError("%s is included, it can only have %s, not %s" % (
+            yaml_file, ", ".join(PART_KEYS), ", ".join(unknown)))
+    with PROFILE.phase('flatten'):
+        part = {T_STRINGS: flatten_json(obj.get(T_STRINGS) or {}), T_SHARED: obj.get(T_SHARED) or {}}
+    if cache:
+        write_cache(cache, {'hash': digest, 'part': part})
+    return digest, part
+
+
+def merge_parts(obj, yaml_file, parts):
+    """
+    :param obj: parsed catalog, the included Strings and Shared are added to it
+    :param parts: [(file name, what load_part() returned for it)]
+    """
+    for section in PART_KEYS:
+        merged = obj.get(section) or {}
+        if section == T_STRINGS:
+            merged = flatten_json(merged)
+        owners = dict.fromkeys(merged, yaml_file)
+        for name, part in parts:
+            for k, v in part[section].items():
+                if k in owners:
+                    raise GenError("%s %s is in both %s and %s" % (section, k, owners[k], name))
+                owners[k] = name
+                merged[k] = v
+        if merged:
+            obj[section] = merged
+    return obj
+
+
+def load_catalog(yaml_file, cache_dir=None):
+    """
+    normalize() the YAML file and the files it includes, the result is pickled under cache_dir keyed by
+    their content hashes, so unchanged YAML files are never parsed again. Every included file is cached on
+    its own as well, editing one of them only parses that one again
+    """
+    with open(yaml_file, 'rb') as f:
+        raw = f.read()
+    digest = hashlib.sha1(raw).hexdigest()
+    cache = cache_file(cache_dir, yaml_file, 'pickle')
+    cached = read_cache(cache, digest)
+    if cached is not None:
+        try:
+            if {name: file_hash(name) for name in include_files(yaml_file, cached['include'])} == cached['files']:
+                PROFILE.count('cache hits')
+                return cached['catalog']
+        except GenError:
+            pass  # an included file is gone, let the parsing tell
+    with PROFILE.phase('yaml load'):
+        obj = yaml.load(raw, Loader=YAML_LOADER)
+    include = obj.get(T_INCLUDE) if isinstance(obj, dict) else None
+    files = {}
+    if include:
+        parts = []
+        for name in include_files(yaml_file, include):
+            files[name], part = load_part(name, cache_dir)
+            parts.append((name, part))
+        obj = merge_parts(dict(obj), yaml_file, parts)
+    catalog = normalize(obj)
+    if cache:
+        write_cache(cache, {'hash': digest, 'include': include, 'files': files, 'catalog': catalog})
+    return catalog
+
+
+def main(
+        YAMLFILE,
+        OUTPUTDIR,
+        HELPER_NAME,
+        DEFAULT_CLS,
+        DEFAULT_OBJ,
+        INTERFACE_ONLY,
+        ARGS="",
+        CACHE_DIR=None,
+        JOBS=1,
+        FORCE=False,
+        CACHED=False,
+        DEFERRED=False,
+        PACKED=False,
+):
+    catalog = load_catalog(YAMLFILE, CACHE_DIR)
+    manifest_file = CACHE_DIR and os.path.join(CACHE_DIR, '%s.manifest.json' % hashlib.sha1(
+        os.path.realpath(YAMLFILE).encode()).hexdigest())
+    manifest = {} if FORCE else load_manifest(manifest_file)
+    last_keys = manifest.get('keys', {})
+    diagnostics = []
+    outputs = render(catalog, YAMLFILE, OUTPUTDIR, HELPER_NAME, DEFAULT_CLS, DEFAULT_OBJ, INTERFACE_ONLY, ARGS,
+                     JOBS, manifest, CACHED, DEFERRED, PACKED, diagnostics)
+    for message in diagnostics:
+        print(message, file=sys.stderr)
+
+    def write(item):
+        name, content = item
+        with PROFILE.phase('write'), open(name, "w") as f:
+            f.write(content)
+        PROFILE.count('files written')
+        PROFILE.count('bytes written', len(content.encode()))
+
+    for name in outputs:
+        os.makedirs(os.path.dirname(name) or '.', exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(JOBS, 1)) as pool:
+        list(pool.map(write, outputs.items()))
+    changed = sum(last_keys.get(k) != v for k, v in manifest.get('keys', {}).items())
+    print("%s%d file(s) regenerated" % ("%d key(s) changed, " % changed if last_keys else "", len(outputs)),
+          file=sys.stderr)
+    if manifest_file:
+        files = {name: stat for name, stat in manifest.get('files', {}).items() if os.path.exists(name)}
+        files.update({name: file_stat(name) for name in outputs})
+        manifest['files'] = files
+        save_manifest(manifest_file, manifest)
+
+
+def file_stat(name):
+    try:
+        st = os.stat(name)
+        return [st.st_mtime_ns, st.st_size]
+    except OSError:
+        return None
+
+
+def load_manifest(path):
+    """
+    :return: what render() left in the manifest last time, empty if the generator changed, or any of
+        the files it generated has been changed or removed since
+    """
+    if not path or not os.path.isfile(path):
+        return {}
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except ValueError:
+        return {}
+    if manifest.get('version') != GEN_VERSION or \
+            any(file_stat(name) != stat for name, stat in manifest.get('files', {}).items()):
+        return {}
+    return manifest
+
+
+def save_manifest(path, manifest):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = '%s.%d' % (path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(dict(manifest, version=GEN_VERSION), f)
+    os.replace(tmp, path)
+
+
+def watch(yaml_file, build, interval=0.5):
+    """
+    keep running, call build() whenever the content of the YAML file, or of a file it includes, changes
+    """
+    last_stat = last_hash = root_hash = None
+    include = None
+
+    def watched():
+        try:
+            return [yaml_file] + include_files(yaml_file, include)
+        except GenError:  # a missing file fails the build, which says so
+            return [yaml_file]
+
+    def stats(files):
+        ret = []
+        for name in files:
+            try:
+                st = os.stat(name)
+                ret.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                ret.append(None)
+        return ret
+
+    print("Watching %s, press Ctrl-C to stop" % yaml_file)
+    try:
+        while True:
+            files = watched()
+            stat = stats(files)
+            if stat[0] and stat != last_stat:
+                last_stat = stat
+                digest = {name: file_hash(name) for name, st in zip(files, stat) if st}
+                if digest[yaml_file] != root_hash:  # what it includes might have changed
+                    root_hash = digest[yaml_file]
+                    try:
+                        with open(yaml_file, 'rb') as f:
+                            obj = yaml.load(f.read(), Loader=YAML_LOADER)
+                        include = obj.get(T_INCLUDE) if isinstance(obj, dict) else None
+                    except yaml.YAMLError:
+                        include = None
+                    files = watched()
+                    last_stat = stats(files)
+                    digest = {name: file_hash(name) for name, st in zip(files, last_stat) if st}
+                if digest != last_hash:
+                    last_hash = digest
+                    start = time.time()
+                    try:
+                        build()
+                        print("[%s] %s regenerated in %.2fs" % (time.strftime('%H:%M:%S'), yaml_file,
+                                                                time.time() - start))
+                    except Exception as e:  # keep watching, the next save might fix it
+                        print("[%s] %s failed: %s" % (time.strftime('%H:%M:%S'), yaml_file, e),
+                              file=sys.stderr)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stop watching %s" % yaml_file)
+
+
+# options changing how a run goes but not what it generates, and if they take a value
+RUN_OPTIONS = {'-W': False, '--watch': False, '--interval': True, '-j': True, '--jobs': True, '--cache_dir': True,
+               '--no_cache': False, '-f': False, '--force': False, '--profile': True, '--profile_format': True}
+
+
+def output_args(argv):
+    """
+    :return: the command line noted in the generated files, without RUN_OPTIONS, so they don't make the
+        files and the manifest's shape change
+    """
+    ret = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+            continue
+        option = arg.split('=', 1)[0]
+        if option in RUN_OPTIONS:
+            skip = RUN_OPTIONS[option] and '=' not in arg
+        elif not (arg[:2] in RUN_OPTIONS and not arg.startswith('--') and RUN_OPTIONS[arg[:2]]):  # -j4
+            ret.append(arg)
+    return " ".join(ret)
 
 
 SAMPLE_YAML = '''
@@ -431,7 +1320,6 @@ Strings:
           Incomplete: 你可能忘了打卡？
 '''
 if __name__ == '__main__':
-    import sys
     import argparse
 
     parser = argparse.ArgumentParser(description='Process some integers.')
@@ -448,15 +1336,63 @@ if __name__ == '__main__':
     parser.add_argument('-I', '--interface_only', action='store_true', default=False,
                         help='Save to an individual interface class file without generating others')
 
+    parser.add_argument('-C', '--cached', action='store_true', default=False,
+                        help='Generate a helper that creates every language instance once, and resolves locales '
+                             'from precomputed tables (can be set as cached in the YAML settings)')
+
+    parser.add_argument('-D', '--deferred', action='store_true', default=False,
+                        help='Generate every language as a library of its own, loaded deferred when its locale is '
+                             'loaded, the default language excepted (can be set as deferred in the YAML settings)')
+
+    parser.add_argument('-P', '--packed', action='store_true', default=False,
+                        help='Save the strings of every language as a JSON asset read by index, instead of '
+                             'generating a class per language, for very large catalogs '
+                             '(can be set as packed in the YAML settings, with asset_dir for where the app '
+                             'loads them from)')
+
+    parser.add_argument('-W', '--watch', action='store_true',
+                        help='Keep running and regenerate whenever the YAML file changes')
+    parser.add_argument('--interval', type=float, default=0.5,
+                        help='How many seconds to wait between polling the YAML file in watch mode')
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help='How many worker processes to generate the languages with, '
+                             'default to the number of CPUs')
+    parser.add_argument('--cache_dir',
+                        help='Where to cache the parsed YAML file, default to %s next to it' % T_CACHE_DIR)
+    parser.add_argument('--no_cache', action='store_true',
+                        help='Always parse the YAML file and regenerate everything, don\'t cache anything')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='Regenerate every file, even if its strings did not change since the last run')
+    parser.add_argument('--profile',
+                        help='Save per phase timings and counters of the run to the given file')
+    parser.add_argument('--profile_format', choices=['json', 'chrome'], default='json',
+                        help='Save the profile as a JSON report, or as a chrome://tracing trace')
     parser.add_argument('--example', action='store_true',
                         help='show an example YAML')
     args = parser.parse_args()
     if args.example:
         print(SAMPLE_YAML)
         sys.exit(1)
-    used = " ".join(sys.argv[1:])
-    if not os.path.exists(args.output):
-        os.makedirs(args.output, exist_ok=True)
+    used = output_args(sys.argv[1:])
+    PROFILE.enabled = bool(args.profile)
+    cache_dir = None if args.no_cache else os.path.join(
+        args.cache_dir or os.path.join(os.path.dirname(os.path.realpath(args.yaml)), T_CACHE_DIR), 'configs')
 
-    main(args.yaml, args.output, args.helper, args.interface, args.static, args.interface_only,
-         ARGS=used)
+    def run():
+        try:
+            main(args.yaml, args.output, args.helper, args.interface, args.static, args.interface_only,
+                 ARGS=used, CACHE_DIR=cache_dir, JOBS=args.jobs or os.cpu_count() or 1, FORCE=args.force,
+                 CACHED=args.cached, DEFERRED=args.deferred,
+                 PACKED=args.packed)
+        finally:
+            if args.profile:
+                PROFILE.save(args.profile, args.profile_format)
+
+    if args.watch:
+        watch(args.yaml, run, args.interval)
+    else:
+        try:
+            run()
+        except GenError as e:
+            print(e, file=sys.stderr)
+            sys.exit(-1)
@@ -1,7 +1,16 @@
 import argparse
+import contextlib
+import copy
+import functools
+import hashlib
+import io
+import json
 import os
+import pickle
 import re
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from string import Template
 import yaml
 
@@ -17,60 +26,329 @@ T_PATH = 'path'
 T_CODE = 'code'
 T_PARTCODE = T_PART + T_CODE
 T_USEREPLAY = 'useReplay'
+T_HYDRATE = 'hydrate'  # how a HydratedBloc persists: {debounce: 500ms, persistOn: [fields]}
+T_DEBOUNCE = 'debounce'
+T_PERSIST_ON = 'persistOn'
+T_TRANSFORMER = 'transformer'  # how a bloc handles an event while the previous one is still being handled
+T_THROTTLE = 'throttle'
+T_PROPS = 'props'
 T_EQUATABLE = 'Equatable'
 T_EQUAL = 'equal'
+T_EQUALITY = 'equality'  # how states compare, with Equatable's props or with generated ==/hashCode
+EQ_GENERATED = 'generated'
+JSON_INLINE = 'inline'  # useJson value generating fromJson/toJson bodies instead of json_serializable's
 T_PARENT = 'parent'
+T_PROJECT = 'project'
+T_WATCH = 'watch'
+YAML_EXTS = ('.yaml', '.yml')
+# directories never holding bloc YAML files, skipped when walking a project tree
+SKIP_DIRS = {'build', 'node_modules', 'ios', 'android', 'web', 'macos', 'linux', 'windows'}
+T_CACHE_DIR = '.stategen'  # where generator keeps its build database, relative to the YAML or project root
+BUILD_DB = 'builds.json'
+DART_INDEX_FILE = 'dart_index.json'  # classes and fields scanned from dart files
+CONFIG_CACHE = 'configs'  # parsed YAML files
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)  # libyaml's loader is a lot faster when it's there
+
+def _skip_space(spec, i):
+    n = len(spec)
+    while i < n and spec[i].isspace():
+        i += 1
+    return i
+
+
+def _scan_word(spec, i):
+    n = len(spec)
+    while i < n and (spec[i].isalnum() or spec[i] in '_$'):
+        i += 1
+    return i
+
+
+def _scan_closing(spec, i):
+    """i points to an opening < or (, return the index after its matching closing one, -1 if none"""
+    pairs = {'<': '>', '(': ')'}
+    stack = []
+    for j in range(i, len(spec)):
+        c = spec[j]
+        if c in pairs:
+            stack.append(pairs[c])
+        elif c in '>)':
+            if not stack or stack.pop() != c:
+                return -1
+            if not stack:
+                return j + 1
+    return -1
+
+
+def _scan_type(spec, i):
+    """
+    scan a dart type starting from i, such as Map<String, List<int>>?, void Function(int a)? or (int, String)
+    :return: index after the type, -1 if it's not a type
+    """
+    n = len(spec)
+    while True:
+        if i < n and spec[i] == '(':  # record type
+            i = _scan_closing(spec, i)
+        else:
+            end = _scan_word(spec, i)
+            while end < n - 1 and spec[end] == '.' and spec[end + 1].isalpha():  # prefixed like ui.Color
+                end = _scan_word(spec, end + 1)
+            if end == i:
+                return -1
+            i = end
+            if i < n and spec[i] == '<':
+                i = _scan_closing(spec, i)
+        if i < 0:
+            return -1
+        if i < n and spec[i] == '?':
+            i += 1
+        k = _skip_space(spec, i)
+        if spec.startswith('Function', k) and _scan_word(spec, k) == k + 8:  # function type
+            i = k + 8
+            if i < n and spec[i] == '<':
+                i = _scan_closing(spec, i)
+            if i < 0 or i >= n or spec[i] != '(':
+                return -1
+            i = _scan_closing(spec, i)
+            if i < 0:
+                return -1
+            if i < n and spec[i] == '?':
+                i += 1
+            k = _skip_space(spec, i)
+            if not spec.startswith('Function', k):
+                return i
+            i = k
+            continue
+        return i
+
+
+def _split_comment(rest):
+    """split the rest of the spec into value and // comment, // inside a quoted string is not a comment"""
+    quote = None
+    i = 0
+    n = len(rest)
+    while i < n:
+        c = rest[i]
+        if quote:
+            if c == '\\':
+                i += 1
+            elif c == quote:
+                quote = None
+        elif c in '"\'':
+            quote = c
+        elif c == '/' and rest.startswith('//', i):
+            return rest[:i], rest[i:]
+        i += 1
+    return rest, ''
+
+
+@functools.lru_cache(maxsize=None)
+def parse_prop(spec):
+    """
+    single pass parser of a prop spec like: Map<String, List<int>>? cache={}// comment (jk@cacheKey)
+    the type is optional and default to String
+    :return: (clsname, cls, optional, name, value, comment, JsonKey)
+    """
+    clsname = cls = optional = name = ''
+    i = _skip_space(spec, 0)
+    end = _scan_type(spec, i)
+    if end > 0:
+        k = _skip_space(spec, end)
+        name_end = _scan_word(spec, k)
+        if name_end > k and (k > end or spec[end - 1] in '>?)'):
+            clsname = spec[i:end]
+            name = spec[k:name_end]
+            i = name_end
+    if not name:  # lesser one, only name and value
+        name_end = _scan_word(spec, i)
+        name = spec[i:name_end]
+        i = name_end
+    if clsname:
+        optional = '?' if clsname.endswith('?') else ''
+        cls = clsname[:-1] if optional else clsname
+    else:
+        clsname = cls = 'String'  # default to string
+    value, comment = _split_comment(spec[i:])
+    json_key = ''
+    start = comment.find('(jk@')
+    while start >= 0:  # if user has specified JsonKey in comments or not
+        close = comment.find(')', start)
+        if close < 0:
+            break
+        json_key = json_key or comment[start + 4:close].strip()
+        comment = comment[:start] + comment[close + 1:]
+        start = comment.find('(jk@', start)
+    return clsname, cls, optional, name, value, comment, json_key
+
 
 class Vars:
-    comm = r'(//.*$)'
-    # clasname has all class name including optional ?,
-    # name as the variable name,
-    # value as the default value if applicable
-    pattern = r'^(?:(?P<clsname>(?P<cls>[\w<,>]+)(?P<optional>\??))\s+)(?P<name>\w+)(?P<value>.*)?$'
-    lesser = r'(?P<name>\w+)(?P<value>=.*)?$'
-    # if user has specified JsonKey in comments or not
-    json_key_pattern = r'\(jk@\s*(?P<JsonKey>.*?)\)'
+    """
+    one prop of a state or an event, clsname has the class name including optional ?,
+    name as the variable name, value as the default value if applicable
+    """
 
     def __init__(self, arg):
         self.origin = arg
-        match = re.match(self.pattern, arg)
-        self.args = {'clsname': 'String'}  # default to string
-        if match:
-            self.args = match.groupdict()
-        else:
-            short = re.match(self.lesser, arg)
-            if short:
-                self.args.update(short.groupdict())
-        if self.args.get('value', None) is None:
-            self.args['value'] = ''
-        value = self.args['value']
-        comment = re.findall(self.comm, value)
-        if comment:
-            self.comment = comment[0]
-            self.args['value'] = re.sub(self.comm, '', value)
-            jk = re.findall(self.json_key_pattern, self.comment)
-            if jk:
-                self.comment = re.sub(self.json_key_pattern, '', self.comment)
-                self.args['JsonKey'] = jk[0]
-        else:
-            self.comment = ''
-        for name in "clsname cls optional name value JsonKey".split():
-            value = self.args.get(name, '')
-            setattr(self, name, value or '')
+        (self.clsname, self.cls, self.optional, self.name,
+         self.value, self.comment, self.JsonKey) = parse_prop(arg)
+
+
+class Profiler:
+    """
+    Per phase timings and counters of a run, saved as JSON or as a Chrome trace (chrome://tracing).
+    It does nothing until enabled.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.start = time.perf_counter()
+        self.spans = []  # [name, start, seconds, yaml, pid], perf_counter is shared by worker processes
+        self.counters = {}
+        self.yaml = ''  # YAML the current spans belong to
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append([name, start, time.perf_counter() - start, self.yaml, os.getpid()])
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def take(self):
+        """hand over what's been collected so far, used to ship results from worker processes"""
+        ret = {'spans': self.spans, 'counters': self.counters}
+        self.spans, self.counters = [], {}
+        return ret
+
+    def merge(self, collected):
+        self.spans.extend(collected['spans'])
+        for name, n in collected['counters'].items():
+            self.count(name, n)
+
+    def report(self):
+        phases = {}
+        yamls = {}
+        for name, start, seconds, yaml_file, pid in self.spans:
+            phase = phases.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            phase['seconds'] += seconds
+            phase['calls'] += 1
+            if yaml_file:
+                per_yaml = yamls.setdefault(yaml_file, {})
+                per_yaml[name] = per_yaml.get(name, 0.0) + seconds
+        return {
+            'seconds': time.perf_counter() - self.start,
+            'phases': phases,
+            'counters': self.counters,
+            'yamls': yamls,
+        }
+
+    def chrome_trace(self):
+        return {'traceEvents': [
+            {'name': name, 'cat': 'stategen', 'ph': 'X', 'ts': (start - self.start) * 1e6, 'dur': seconds * 1e6,
+             'pid': pid, 'tid': pid, 'args': {'yaml': yaml_file}}
+            for name, start, seconds, yaml_file, pid in self.spans
+        ] + [
+            {'name': name, 'ph': 'C', 'ts': 0, 'pid': os.getpid(), 'args': {name: n}}
+            for name, n in self.counters.items()
+        ]}
+
+    def save(self, path, fmt='json'):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace() if fmt == 'chrome' else self.report(), f, indent=1, sort_keys=True)
+
+
+PROFILE = Profiler()
 
 
 class DartTemplate(Template):
     delimiter = '%'
 
 
+@functools.lru_cache(maxsize=None)
+def compile_template(template):
+    """
+    Split a DartTemplate into literal chunks and placeholders once.
+    :return: render(**mapping), the same as DartTemplate(template).safe_substitute(**mapping)
+    """
+    parts = []  # literal strings, and (name, placeholder) tuples
+    literal = []
+    pos = 0
+    for m in DartTemplate.pattern.finditer(template):
+        literal.append(template[pos:m.start()])
+        pos = m.end()
+        name = m.group('named') or m.group('braced')
+        if name:
+            parts.append(''.join(literal))
+            parts.append((name, m.group()))
+            literal = []
+        elif m.group('escaped') is not None:
+            literal.append(DartTemplate.delimiter)
+        else:  # invalid placeholder, kept as it is
+            literal.append(m.group())
+    literal.append(template[pos:])
+    parts.append(''.join(literal))
+
+    def render(**mapping):
+        return ''.join([p if p.__class__ is str else str(mapping[p[0]]) if p[0] in mapping else p[1]
+                        for p in parts])
+
+    return render
+
+
+class GenError(Exception):
+    """what error() raises, the command line prints it and exits"""
+
+
 def error(*msg):
-    print(*msg, file=sys.stderr)
-    sys.exit(-1)
+    raise GenError(' '.join(str(m) for m in msg))
+
+
+DURATION = re.compile(r'^\s*(\d+)\s*(ms|s|m)?\s*$')
+DURATION_MS = {'ms': 1, 's': 1000, 'm': 60000}
+
+
+def parse_duration(value):
+    """:return: milliseconds of 500, '500ms', '2s' or '1m'"""
+    match = DURATION.match(str(value))
+    if not match:
+        error("%s is not a duration, use something like 500ms, 2s or 1m" % value)
+    return int(match.group(1)) * DURATION_MS[match.group(2) or 'ms']
+
 
+BLOC_CONCURRENCY = 'package:bloc_concurrency/bloc_concurrency.dart'
+STREAM_TRANSFORM = 'package:stream_transform/stream_transform.dart'
+CONCURRENCY = ('concurrent', 'sequential', 'droppable', 'restartable')
 
-def state_gen(args, data=None):
+
+def parse_transformer(event, spec):
+    """
+    :param spec: restartable, sequential, droppable, concurrent, debounce:300ms or throttle:300ms
+    :return: the transformer: argument of on<event>() and the imports it needs
+    """
+    name, _, duration = str(spec).strip().partition(':')
+    name = name.strip()
+    if name in CONCURRENCY and not duration:
+        return '%s()' % name, (BLOC_CONCURRENCY,)
+    if name in (T_DEBOUNCE, T_THROTTLE) and duration:
+        duration = 'const Duration(milliseconds: %d)' % parse_duration(duration)
+        if name == T_DEBOUNCE:  # handle the last event once they stop coming, cancel the one running
+            return '(events, mapper) => events.debounce(%s).switchMap(mapper)' % duration, (STREAM_TRANSFORM,)
+        return '(events, mapper) => droppable<%s>().call(events.throttle(%s), mapper)' % (event, duration), \
+            (BLOC_CONCURRENCY, STREAM_TRANSFORM)
+    error("%s: unknown transformer %s, use one of %s, %s:300ms or %s:300ms" % (
+        event, spec, ', '.join(CONCURRENCY), T_DEBOUNCE, T_THROTTLE))
+
+
+def state_gen(args, data=None, session=None):
     fields = shared_fields({
         T_EQUAL: True,
+        T_EQUALITY: 'equatable',
         T_PARENT: '',
         'init': False,
         'name': None,
@@ -78,10 +356,15 @@ def state_gen(args, data=None):
         'props': [],
         'exclude': None,  # can exclude certain props that matches this pattern
         'include': '^.*$',  # default include all props
-        'useJson' : True
+        'useJson' : True,
+        'jsonEnums': [],  # enum types, (de)serialized by name when useJson is inline
     }
     )
-    sync_data(args, fields, data)
+    session = session or Session()
+    sync_data(args, fields, data, session)
+    if getattr(args, 'jsonInline', False):
+        args.useJson = JSON_INLINE
+    inline = args.useJson == JSON_INLINE
 
     if not args.name:
         error("Missing class name")
@@ -90,20 +373,24 @@ def state_gen(args, data=None):
         error("We need some properties")
 
     parent = args.parent
-    parent_class = T_EQUATABLE if args.equal else ''
-    vars = []
-    for v in args.props:
-        vars.append(Vars(v))
+    generated = args.equality == EQ_GENERATED
+    parent_class = T_EQUATABLE if args.equal and not generated else ''
+    with PROFILE.phase('prop parsing'):
+        vars = [Vars(v) for v in args.props]
+    PROFILE.count('props', len(vars))
 
     final = []
     const = []
     fact = 'factory %clsname.fromJson(Map<String,dynamic> json)=>_$%clsnameFromJson(json);\n  Map<String, dynamic> toJson() => _$%clsnameToJson(this);\n'.replace(
-        '%clsname', args.name) if args.useJson else ''
+        '%clsname', args.name) if args.useJson and not inline else ''
+    json_fields = []  # (json key, class, name, default value) for inline JSON
     copyWithArgs = []
     copyWithBody = []
     props = []
+    types = {}  # prop name to its class
     init = '%clsname init() {\n   return %clsname();\n  }'.replace('%clsname',
                                                                    args.name) if args.init else ''
+    copy_with = compile_template('%name: %name ?? this.%name')
     for v in vars:
         final.append('%s%s\n  final %s %s' % (
             v.comment,
@@ -114,35 +401,47 @@ def state_gen(args, data=None):
             '%s this.%s%s' % (
                 '' if (v.value and v.value.strip()) or v.optional else 'required', v.name, v.value))
         copyWithArgs.append('%s? %s' % (v.cls, v.name))
-        copyWithBody.append(DartTemplate('%name: %name ?? this.%name').safe_substitute(name=v.name))
+        copyWithBody.append(copy_with(name=v.name))
+        json_fields.append((v.JsonKey or v.name, v.clsname, v.name, v.value.strip().lstrip('=').strip()))
         if args.equal:
             to_append = v.name
+            PROFILE.count('regex evaluations', bool(args.include) + bool(args.exclude))
             if args.include and not re.match(args.include, to_append): continue
             if args.exclude and re.match(args.exclude, to_append): continue
             props.append(to_append)
+            types[to_append] = v.cls
 
     if parent:  # parent class specified, and should be a reachable relative path
-        parent_content = load_content(parent)
-        if parent_content:
-            result = get_class(parent_content, True)
-            if result:
-                parent_class = result
+        parent_classes = session.classes(parent)
+        if parent_classes is not None:
+            if parent_classes:
+                result = parent_classes[0]
+                parent_class = result['name']
                 args.equal = True
                 # properties defined in parent_class
-                keys_pattern = r'final\s+(\S*?)(\?){0,1}\s+(\S+);'
-                result = re.findall(keys_pattern, parent_content)
-                if result:
-                    for (key_type, optional, key) in result:
+                if result['fields']:
+                    for (key_type, optional, key) in result['fields']:
                         const.append('%ssuper.%s' %
                                      ('' if optional else 'required ', key))
                         copyWithArgs.append('%s? %s' % (key_type, key))
-                        copyWithBody.append(DartTemplate('%name: %name ?? this.%name').safe_substitute(name=key))
+                        copyWithBody.append(copy_with(name=key))
+                        json_fields.append((key, key_type + optional, key, ''))
                     props.append('...super.props')
 
         else:
             error("%s specified but not existent or no content" % parent)
     ext = 'extends %s' % parent_class if parent_class else ''
-    ret = DartTemplate("""
+    if inline:
+        fact = generate_json(args.name, json_fields, args.jsonEnums or [], args.jsonConverter)
+    args.deepEquality = False  # all_gen imports package:collection for it
+    if args.equal and generated:
+        equality, args.deepEquality = generate_equality(args.name, props, types, [v.name for v in vars])
+        # without a dest the state is printed, its library is then relative to the session root
+        library = session.read(os.path.join(os.path.dirname(args.dest or ''), args.part)) if args.part else None
+        if args.deepEquality and library and "'%s'" % COLLECTION_IMPORT not in library:
+            session.note("%s: add import '%s'; for the generated ==" % (args.part, COLLECTION_IMPORT))
+    with PROFILE.phase('render'):
+        ret = compile_template("""
 %part
 %serial
 %converter
@@ -164,43 +463,212 @@ class %clsname %ext {
   %props
 
 }
-""").safe_substitute(
-        serial='@JsonSerializable(explicitToJson: true)' if args.useJson else '',
-        clsname=args.name,
-        final=';\n  '.join(final),
-        const=', '.join(const),
-        copyWithArgs=', '.join(copyWithArgs),
-        copyWithBody=',\n      '.join(copyWithBody),
-        props='@override\n  List<Object?> get props => [\n    %s\n];\n' % (
-            ',\n    '.join(props)) if args.equal else '',
-        ext=ext,
-        fact=fact,
-        part="part of '%s';\n" % args.part if args.part else '',
-        init=init,
-        converter='@%s()' % args.jsonConverter if args.jsonConverter else ''
-    )
-    if args.dest:
-        write_content(args.dest, ret, args.overwrite)
+""")(
+            serial='@JsonSerializable(explicitToJson: true)' if args.useJson and not inline else '',
+            clsname=args.name,
+            final=';\n  '.join(final),
+            const=', '.join(const),
+            copyWithArgs=', '.join(copyWithArgs),
+            copyWithBody=',\n      '.join(copyWithBody),
+            props=equality if args.equal and generated else '@override\n  List<Object?> get props => [\n    %s\n];\n' % (
+                ',\n    '.join(props)) if args.equal else '',
+            ext=ext,
+            fact=fact,
+            part="part of '%s';\n" % args.part if args.part else '',
+            init=init,
+            converter='@%s()' % args.jsonConverter if args.jsonConverter and not inline else ''
+        )
+    session.write(args.dest, ret, args.overwrite)
     return ret
 
 
-def write_content(dest, ret, overwrite=True):
-    if dest:
-        if overwrite or not os.path.exists(dest):
-            dirname = os.path.realpath(os.path.dirname(dest))
-            if not dirname:
-                yes = input("You didn't specify a right directory name, are you sure? (Y/N)")
-                if yes.lower()[0] != 'y':
-                    error("%s needs to have a directory path" % dest)
-                else:
-                    print("Continue anyway!")
-            if dirname and not os.path.exists(dirname):
-                os.makedirs(dirname)
-            with open(dest, 'w') as f:
-                f.write(ret)
+COLLECTION_TYPES = re.compile(r'^(List|Map|Set|Iterable)\b')
+COLLECTION_IMPORT = 'package:collection/collection.dart'
+
+
+def generate_equality(clsname, props, types, fields):
+    """
+    == and hashCode comparing the props one by one, instead of Equatable allocating and walking a props list
+    every time, the hash code is computed once per instance
+    :param props: prop names, with ...super.props if the parent class has its own
+    :param types: prop name to its class, collections are compared by content
+    :param fields: every field, shown by toString() in debug builds
+    :return: the code, and if it compares collections with package:collection's DeepCollectionEquality
+    """
+    equals = ['runtimeType == other.runtimeType']
+    hashes = ['runtimeType']
+    deep = False
+    for prop in props:
+        if prop == '...super.props':
+            equals.append('super == other')
+            hashes.append('super.hashCode')
+        elif COLLECTION_TYPES.match(types[prop]):
+            deep = True
+            equals.append('_equality.equals(%s, other.%s)' % (prop, prop))
+            hashes.append('_equality.hash(%s)' % prop)
+        else:
+            equals.append('%s == other.%s' % (prop, prop))
+            hashes.append(prop)
+    code = compile_template('''%deep_equality
+  static final _hashes = Expando<int>();
+
+  @override
+  bool operator ==(Object other) =>
+      identical(this, other) ||
+      other is %clsname &&
+          %equals;
+
+  @override
+  int get hashCode => _hashes[this] ??= Object.hashAll([
+        %hashes,
+      ]);
+
+  @override
+  String toString() => const bool.fromEnvironment('dart.vm.product')
+      ? '%clsname'
+      : '%clsname(%fields)';
+''')(
+        deep_equality='static const _equality = DeepCollectionEquality();' if deep else '',
+        clsname=clsname,
+        equals=' &&\n          '.join(equals),
+        hashes=',\n        '.join(hashes),
+        fields=', '.join(['%s: $%s' % (name, name) for name in fields]),
+    )
+    return code, deep
+
+
+def split_type(cls):
+    """:return: class name, type arguments and ? of a dart type like Map<String, List<int>>?"""
+    cls = cls.strip()
+    optional = '?' if cls.endswith('?') else ''
+    cls = cls[:-1] if optional else cls
+    start = cls.find('<')
+    if start < 0 or not cls.endswith('>'):
+        return cls, [], optional
+    type_args = []
+    depth = 0
+    last = start + 1
+    for i in range(start + 1, len(cls) - 1):
+        if cls[i] in '<(':
+            depth += 1
+        elif cls[i] in '>)':
+            depth -= 1
+        elif cls[i] == ',' and not depth:
+            type_args.append(cls[last:i].strip())
+            last = i + 1
+    type_args.append(cls[last:-1].strip())
+    return cls[:start].strip(), type_args, optional
+
+
+JSON_TYPES = {'String', 'bool', 'num', 'Object'}  # taken as they are from JSON
+ITERABLE_TYPES = ('List', 'Set', 'Iterable')
+
+
+def json_decode(cls, expr, enums, converter):
+    """:return: dart expression turning expr, a value decoded from JSON, into cls"""
+    name, type_args, optional = split_type(cls)
+    if name in JSON_TYPES:
+        return '%s as %s%s' % (expr, name, optional)
+    if name == 'dynamic':
+        return expr
+    if optional:
+        return '%s == null ? null : %s' % (expr, json_decode(cls[:-1], expr, enums, converter))
+    if name in ('int', 'double'):
+        return '(%s as num).to%s()' % (expr, name.title())
+    if name == 'DateTime':
+        return 'DateTime.parse(%s as String)' % expr
+    if name == 'Duration':
+        return 'Duration(microseconds: (%s as num).toInt())' % expr
+    if name == 'Uri':
+        return 'Uri.parse(%s as String)' % expr
+    if name in ITERABLE_TYPES:
+        item = json_decode((type_args or ['dynamic'])[0], 'e', enums, converter)
+        return '(%s as List<dynamic>).map((e) => %s).%s()' % (expr, item, 'toSet' if name == 'Set' else 'toList')
+    if name == 'Map':
+        key_type, value_type = type_args if len(type_args) == 2 else ('dynamic', 'dynamic')
+        key = 'int.parse(k)' if key_type == 'int' else '%s.values.byName(k)' % key_type if key_type in enums \
+            else 'k'
+        return '(%s as Map<String, dynamic>).map((k, e) => MapEntry(%s, %s))' % (
+            expr, key, json_decode(value_type, 'e', enums, converter))
+    if name in enums:
+        return '%s.values.byName(%s as String)' % (name, expr)
+    if converter:
+        return 'const %s().fromJson(%s)' % (converter, expr)
+    return '%s.fromJson(%s as Map<String, dynamic>)' % (name, expr)
+
+
+def json_encode(cls, expr, enums, converter):
+    """:return: dart expression turning expr of cls into a value JSON can encode"""
+    name, type_args, optional = split_type(cls)
+    if name in JSON_TYPES or name in ('dynamic', 'int', 'double'):
+        return expr
+    if optional:
+        bang = expr if expr in ('e', 'k') else expr + '!'  # closure parameters are promoted, fields are not
+        value = json_encode(cls[:-1], bang, enums, converter)
+        return expr if value == bang else '%s == null ? null : %s' % (expr, value)
+    if name == 'DateTime':
+        return '%s.toIso8601String()' % expr
+    if name == 'Duration':
+        return '%s.inMicroseconds' % expr
+    if name == 'Uri':
+        return '%s.toString()' % expr
+    if name in ITERABLE_TYPES:
+        item = json_encode((type_args or ['dynamic'])[0], 'e', enums, converter)
+        if item == 'e':
+            return expr if name == 'List' else '%s.toList()' % expr
+        return '%s.map((e) => %s).toList()' % (expr, item)
+    if name == 'Map':
+        key_type, value_type = type_args if len(type_args) == 2 else ('dynamic', 'dynamic')
+        key = 'k.name' if key_type in enums else 'k' if key_type in ('String', 'dynamic') else 'k.toString()'
+        value = json_encode(value_type, 'e', enums, converter)
+        if key == 'k' and value == 'e':
+            return expr
+        return '%s.map((k, e) => MapEntry(%s, %s))' % (expr, key, value)
+    if name in enums:
+        return '%s.name' % expr
+    if converter:
+        return 'const %s().toJson(%s)' % (converter, expr)
+    return '%s.toJson()' % expr
+
+
+def generate_json(clsname, fields, enums, converter=''):
+    """
+    fromJson/toJson of a state, written out instead of generated by json_serializable, so no build_runner
+    :param fields: (json key, class, name, default value)
+    :param enums: enum types, they are (de)serialized by name
+    :param converter: JsonConverter class (de)serializing the types that are neither JSON nor enums
+    """
+    decode = []
+    encode = []
+    for key, cls, name, default in fields:
+        expr = "json['%s']" % key
+        if default:  # missing or null in JSON, the default value just like json_serializable
+            value = json_decode(cls if cls.endswith('?') else cls + '?', expr, enums, converter)
+            value = '(%s) ?? %s' % (value, default) if ' ' in value else '%s ?? %s' % (value, default)
+        else:
+            value = json_decode(cls, expr, enums, converter)
+        decode.append('%s: %s' % (name, value))
+        encode.append("'%s': %s" % (key, json_encode(cls, name, enums, converter)))
+    return compile_template('''factory %clsname.fromJson(Map<String, dynamic> json) => %clsname(
+        %decode
+      );
+
+  Map<String, dynamic> toJson() => <String, dynamic>{
+        %encode
+      };
+''')(
+        clsname=clsname,
+        decode=',\n        '.join(decode),
+        encode=',\n        '.join(encode),
+    )
+
 
+def write_summary(stats):
+    return "%d file(s) written (%d bytes), %d unchanged file(s) skipped (%d bytes)" % (
+        stats['written'], stats['bytes'], stats['skipped'], stats['skipped_bytes'])
 
-def sync_data(args, fields, data):
+
+def sync_data(args, fields, data, session):
     if data is None:
         data = {}
     for field, value in fields.items():
@@ -211,7 +679,14 @@ def sync_data(args, fields, data):
             part, _ = os.path.splitext(args.part)
             args.dest = os.path.basename(part) + args.dest
     if hasattr(args, 'path') and args.dest:
-        args.dest = os.path.realpath(os.path.join(args.path, args.dest))
+        args.dest = session.path(os.path.join(args.path, args.dest))
+
+
+def profile_parser(parser):
+    parser.add_argument('--profile',
+                        help='Save per phase timings and counters of this run to the given file')
+    parser.add_argument('--profile_format', choices=['json', 'chrome'], default='json',
+                        help='Save the profile as a JSON report, or as a chrome://tracing trace')
 
 
 def shared_parser(parser):
@@ -223,6 +698,7 @@ def shared_parser(parser):
     parser.add_argument('--dest', help='Where to write the content')
     parser.add_argument('-O', '--overwrite',
                         help='Overwrite existing file', action='store_true')
+    profile_parser(parser)
 
 
 def shared_fields(more: dict):
@@ -248,9 +724,17 @@ def state_parser(parser):
     parser.add_argument('--%s' % T_PARENT,
                         help="Add extends from parent class other than Equatable",
                         required=False)
+    parser.add_argument('--%s' % T_EQUALITY, choices=['equatable', EQ_GENERATED],
+                        help="Compare states with Equatable's props (default), or with generated ==, hashCode "
+                             "and toString")
     parser.add_argument('--useJson',action='store_true',
                          help='Use Json Serialization or not'
                          )
+    parser.add_argument('--jsonInline', action='store_true',
+                        help='Write fromJson/toJson instead of having json_serializable generate them, '
+                             'same as useJson: %s in YAML' % JSON_INLINE)
+    parser.add_argument('--jsonEnums', nargs='+',
+                        help='Enum types of the props, serialized by name with --useJson %s' % JSON_INLINE)
     shared_parser(parser)
 
 
@@ -265,6 +749,11 @@ def bloc_parser(parser):
                         help="Specify if to use hydrate mixins or not")
     parser.add_argument('-u', '--useReplay', action='store_false',
                         help="Specify if to use replay or not")
+    parser.add_argument('--%s' % T_DEBOUNCE,
+                        help="With useHydrate, write the state to storage once it stopped changing for "
+                             "this long, e.g. 500ms")
+    parser.add_argument('--%s' % T_PERSIST_ON, nargs='+',
+                        help="With useHydrate, only write the state when one of these fields changed")
 
     shared_parser(parser)
 
@@ -276,25 +765,522 @@ def event_parser(parser):
     shared_parser(parser)
 
 
-def load_content(name):
-    ret = None
-    if name and os.path.exists(name):
+# comments and strings are skipped as a whole, so braces and semicolons inside them don't count
+DART_TOKEN = re.compile(r"""
+    //[^\n]*
+  | /\*[\s\S]*?\*/
+  | r?'''[\s\S]*?'''
+  | r?\"\"\"[\s\S]*?\"\"\"
+  | r?'(?:\\.|[^'\\\n])*'
+  | r?"(?:\\.|[^"\\\n])*"
+  | [{};]
+""", re.VERBOSE)
+CLASS_HEADER = re.compile(
+    r'(?:^|\s)(?:(?:abstract|sealed|base|final|interface|mixin)\s+)*class\s+(?P<name>\w+)\s*(?:<.*?>)?\s*'
+    r'(?:extends\s+(?P<extends>[\w.]+(?:<.*?>)?))?\s*(?:with\s+(?P<with>[^{]*?))?\s*'
+    r'(?:implements\s+(?P<implements>[^{]*?))?\s*$', re.S)
+FIELD_MODIFIERS = re.compile(r'^\s*(?:@\w+(?:\([^)]*\))?\s*)*(?P<modifiers>(?:(?:static|late|covariant|external)\s+)*)'
+                             r'final\s+(?P<rest>.*)$', re.S)
+
+
+def _split_types(types):
+    return [t.strip() for t in re.split(r',(?![^<]*>)', types or '') if t.strip()]
+
+
+def scan_dart(content):
+    """
+    lightweight dart declaration scanner, it walks through the content once
+    :return: list of classes as {name, extends, with, implements, fields: [[type, optional, name]]}
+    """
+    classes = []
+    depth = 0
+    current = None  # class whose body we are in
+    pos = 0
+    statement = []  # code since the last { } or ; at the current depth
+    for token in DART_TOKEN.finditer(content or ''):
+        text = token.group()
+        statement.append(content[pos:token.start()])
+        pos = token.end()
+        if text not in '{};':
+            if not text.startswith('/'):
+                statement.append("''")  # keep a place holder for the string
+            continue
+        code = ''.join(statement)
+        statement = []
+        if text == '{':
+            if depth == 0:
+                PROFILE.count('regex evaluations')
+                header = CLASS_HEADER.search(code)
+                if header:
+                    current = {
+                        'name': header.group('name'),
+                        'extends': header.group('extends') or '',
+                        'with': _split_types(header.group('with')),
+                        'implements': _split_types(header.group('implements')),
+                        'fields': [],
+                    }
+                    classes.append(current)
+            depth += 1
+        elif text == '}':
+            depth = max(depth - 1, 0)
+            if depth == 0:
+                current = None
+        elif depth == 1 and current is not None:  # a member declaration of the class
+            PROFILE.count('regex evaluations')
+            field = FIELD_MODIFIERS.match(code)
+            if field and 'static' not in field.group('modifiers'):
+                rest = field.group('rest').strip()
+                end = _scan_type(rest, 0)
+                start = _skip_space(rest, end) if end > 0 else -1
+                name_end = _scan_word(rest, start) if start > 0 else -1
+                if name_end > start and not rest[name_end:].strip():  # no initializer
+                    cls = rest[:end]
+                    optional = '?' if cls.endswith('?') else ''
+                    current['fields'].append([cls[:-1] if optional else cls, optional, rest[start:name_end]])
+    return classes
+
+
+class DartIndex:
+    """
+    Classes declared in dart files, persisted on disk so unchanged files are never rescanned.
+    An entry is reused while the file's stat is the same, or its content hash is still the same.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.files = {}
+        self.updates = {}  # entries changed since loaded
+        if path and os.path.isfile(path):
+            try:
+                with open(path) as f:
+                    self.files = json.load(f)
+            except ValueError:
+                print("%s is corrupted, rescan everything" % path, file=sys.stderr)
+
+    def classes(self, name, content=None):
+        """
+        :param content: content of the file if it's generated but not written yet
+        :return: classes declared in the dart file, None if the file is not there
+        """
+        name = os.path.realpath(name)
+        entry = self.files.get(name)
+        if content is not None:  # reuse what's scanned for the same content on disk, it's most likely unchanged
+            digest = hashlib.sha1(content.encode()).hexdigest()
+            if not entry or entry['hash'] != digest:
+                PROFILE.count('dart files scanned')
+                with PROFILE.phase('dart scan'):
+                    entry = {'hash': digest, 'classes': scan_dart(content), 'stat': None}
+                self.files[name] = self.updates[name] = entry
+            else:
+                PROFILE.count('dart index hits')
+            return entry['classes']
+        try:
+            st = os.stat(name)
+        except OSError:
+            return None
+        stat = [st.st_mtime_ns, st.st_size]
+        if entry and entry['stat'] == stat:
+            PROFILE.count('dart index hits')
+            return entry['classes']
+        with open(name, 'rb') as f:
+            raw = f.read()
+        PROFILE.count('files read')
+        digest = hashlib.sha1(raw).hexdigest()
+        if not entry or entry['hash'] != digest:
+            with PROFILE.phase('dart scan'):
+                entry = {'hash': digest, 'classes': scan_dart(raw.decode())}
+            PROFILE.count('dart files scanned')
+        entry['stat'] = stat
+        self.files[name] = self.updates[name] = entry
+        return entry['classes']
+
+    def merge(self, updates):
+        self.files.update(updates)
+        self.updates.update(updates)
+
+    def save(self):
+        if not self.path or not self.updates:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = '%s.%d' % (self.path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(self.files, f)
+        os.replace(tmp, self.path)
+        self.updates = {}
+
+
+STAT_KEYS = ('written', 'skipped', 'bytes', 'skipped_bytes')
+
+
+class Session:
+    """
+    One generation run kept in memory: output path -> content, diagnostics, the event shortcuts and
+    transformers bloc_gen needs from event_gen and the files read or written.
+    Relative paths are resolved against root, files generated earlier in the session are read back
+    from memory, and nothing touches the disk until save().
+    """
+
+    def __init__(self, root=None, index=None):
+        self.root = os.path.realpath(root or os.getcwd())
+        self.index = index if index is not None else DartIndex()
+        self.outputs = {}
+        self.diagnostics = []
+        self.shortcuts = {}  # event -> [shortcut name, [argdef, arg]]
+        self.transformers = {}  # event -> (transformer: argument, imports)
+        self.files = set()  # files read or written, what the build depends on
+        self.written = []  # files save() actually wrote
+
+    def path(self, name):
+        return os.path.realpath(os.path.join(self.root, name))
+
+    def exists(self, name):
+        name = self.path(name)
+        return name in self.outputs or os.path.exists(name)
+
+    def note(self, *msg):
+        self.diagnostics.append(' '.join(str(m) for m in msg))
+
+    def read(self, name):
+        """:return: content of the file, None if it's not there"""
+        if not name:
+            return None
+        name = self.path(name)
+        self.files.add(name)  # remember it even it's not there, creating it later on should trigger a rebuild
+        if name in self.outputs:
+            return self.outputs[name]
+        if not os.path.exists(name):
+            return None
         with open(name) as f:
-            ret = f.read()
-    return ret
+            PROFILE.count('files read')
+            return f.read()
+
+    def write(self, dest, content, overwrite=True):
+        if not dest:
+            return
+        dest = self.path(dest)
+        if overwrite or not self.exists(dest):
+            self.outputs[dest] = content
+            PROFILE.count('bytes produced', len(content.encode()))
+        self.files.add(dest)
+
+    def classes(self, name):
+        """classes declared in a dart file, None if it doesn't exist"""
+        if not name:
+            return None
+        name = self.path(name)
+        self.files.add(name)
+        return self.index.classes(name, self.outputs.get(name))
+
+    def save(self):
+        """
+        write the outputs, files with the same content are left alone
+        :return: write stats
+        """
+        stats = dict.fromkeys(STAT_KEYS, 0)
+        for dest, content in self.outputs.items():
+            size = len(content.encode())
+            with PROFILE.phase('write'):
+                if file_content(dest) == content:  # same content, keep its mtime so build_runner/IDE won't redo it
+                    stats['skipped'] += 1
+                    stats['skipped_bytes'] += size
+                    PROFILE.count('files skipped')
+                    continue
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                with open(dest, 'w') as f:
+                    f.write(content)
+            stats['written'] += 1
+            stats['bytes'] += size
+            self.written.append(dest)
+            PROFILE.count('files written')
+            PROFILE.count('bytes written', size)
+        self.outputs = {}
+        return stats
+
+
+def file_content(name):
+    if not os.path.isfile(name):
+        return None
+    with open(name) as f:
+        return f.read()
+
+
+PART_OF = re.compile(r"^\s*part\s+of\s+'([^']+)'\s*;", re.M)
+G_PART = re.compile(r"^\s*part\s+'([^']+\.g\.dart)'\s*;", re.M)
+
+
+def package_path(name):
+    """:return: path relative to the dart package of name (where pubspec.yaml is), absolute if there isn't one"""
+    folder = os.path.dirname(name)
+    while not os.path.isfile(os.path.join(folder, 'pubspec.yaml')):
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            return name
+        folder = parent
+    return os.path.relpath(name, folder)
+
+
+def build_targets(paths, changed=(), force=False):
+    """
+    :param paths: files of a build, the .g.dart parts of their dart libraries are looked at
+    :param changed: those of paths this run wrote
+    :param force: take every .g.dart part
+    :return: the .g.dart files build_runner has to regenerate: the parts of the libraries with a changed file,
+        and the parts missing or older than a dart file of their library
+    """
+    changed = set(changed)
+    targets = set()
+    for name in sorted(set(paths) | changed):
+        if not name.endswith('.dart') or name.endswith('.g.dart'):
+            continue
+        content = file_content(name) or ''
+        m = PART_OF.search(content)
+        library = os.path.normpath(os.path.join(os.path.dirname(name), m.group(1))) if m else name
+        for part in G_PART.findall(content if library == name else file_content(library) or ''):
+            target = os.path.normpath(os.path.join(os.path.dirname(library), part))
+            if force or name in changed or not os.path.isfile(target) or \
+                    os.path.getmtime(target) < os.path.getmtime(name):
+                targets.add(package_path(target))
+    return sorted(targets)
+
+
+def save_targets(path, targets):
+    """add targets to the changed list at path, one per line, it's appended by every run till it's consumed"""
+    if not path or not targets:
+        return
+    with open(path, 'a') as f:
+        f.write(''.join('%s\n' % t for t in targets))
+
+
+def generate(config, root=None, only=None, index=None):
+    """
+    Generate the files of a bloc YAML in memory, without touching the disk, the working directory or
+    any module state. Errors are raised as GenError.
+    :param config: parsed YAML content, it's left unchanged
+    :param root: directory the paths in config are relative to, default to the current one
+    :param only: processors to run, default to all of them
+    :param index: DartIndex to look up dart classes with, default to a fresh in memory one
+    :return: Session, its outputs are {path: content}, and diagnostics are the messages of the run
+    """
+    session = Session(root, index)
+    all_gen(argparse.Namespace(), data=config_data(copy.deepcopy(config)), only=only, session=session)
+    return session
+
+
+def flush(session):
+    """print the diagnostics and write the outputs of a session, :return: write stats"""
+    for message in session.diagnostics:
+        print(message)
+    session.diagnostics = []
+    return session.save()
+
+
+SHORTCUT_MARK = "/// shortcut functions"
+SHORTCUT_MARK_END = "/// end shortcut"
+REGISTRATION = re.compile(r'\bon<(\w+)>\s*\(')
+# a generated registration, with or without a transformer, alone in its statement
+GEN_REGISTRATION = re.compile(r'\bon<(\w+)>\s*\(\s*_on\1\s*(?:,\s*transformer:[^;]*)?\)(?=\s*$)')
+HANDLER = re.compile(r'\b_on(\w+)\s*\(')
+
+
+class BlocMerger:
+    """
+    Parse an existing bloc file once into its regions: the constructor with its on<Event>(...)
+    registrations, the shortcut block between the shortcut marks and the handler methods,
+    then insert whatever is missing in one pass.
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.class_close = -1  # where the bloc class' closing } is
+        self.ctor_open = self.ctor_close = -1  # { and } of the constructor body
+        self.mark = self.mark_end = -1  # where the shortcut mark lines start
+        self.registered = []  # events with an on<Event>(...) in the constructor
+        self.registrations = {}  # event -> (start, end) of its generated on<Event>(...) call
+        self.handlers = set()  # events with a _onEvent method
+        self.parse()
+
+    def line_start(self, pos):
+        return self.content.rfind('\n', 0, pos) + 1
+
+    def parse(self):
+        content = self.content
+        depth = 0
+        in_class = False
+        pos = 0
+        statement = []
+        for token in DART_TOKEN.finditer(content):
+            text = token.group()
+            start = pos
+            code = content[pos:token.start()]
+            pos = token.end()
+            if in_class and depth == 2 and self.ctor_open >= 0 and self.ctor_close < 0:
+                PROFILE.count('regex evaluations')
+                self.registered.extend(REGISTRATION.findall(code))
+                if text == ';':
+                    call = GEN_REGISTRATION.search(code)
+                    if call:
+                        self.registrations[call.group(1)] = (start + call.start(), start + call.end())
+            if in_class and depth == 1:
+                PROFILE.count('regex evaluations')
+                self.handlers.update(HANDLER.findall(code))
+            statement.append(code)
+            if text not in '{};':
+                stripped = text.strip()
+                if stripped == SHORTCUT_MARK:
+                    self.mark = self.line_start(token.start())
+                elif stripped == SHORTCUT_MARK_END:
+                    self.mark_end = self.line_start(token.start())
+                continue
+            code = ''.join(statement)
+            statement = []
+            if text == '{':
+                if depth == 0 and not in_class and CLASS_HEADER.search(code):
+                    in_class = True
+                elif depth == 1 and in_class and self.ctor_open < 0 and 'super' in code:
+                    self.ctor_open = token.start()
+                depth += 1
+            elif text == '}':
+                depth -= 1
+                if in_class and depth == 1 and self.ctor_open >= 0 and self.ctor_close < 0:
+                    self.ctor_close = token.start()
+                elif in_class and depth == 0:
+                    self.class_close = token.start()
+                    break
+
+    @property
+    def valid(self):
+        return self.class_close > 0 and self.ctor_close > 0 and bool(self.registered) and bool(self.handlers)
+
+    def merge(self, events):
+        """
+        :param events: [(event, registration, handler method, shortcut, has transformer)] for all the events
+        :return: merged content and what's been added as {registrations: [], handlers: [], shortcuts: [],
+            transformers: []}, registrations of events having a transformer are replaced when it's changed
+        """
+        content = self.content
+        added = {'registrations': [], 'handlers': [], 'shortcuts': [], 'transformers': []}
+        registrations = []
+        handlers = []
+        shortcuts = []
+        inserts = []  # (position, text)
+        replaces = []  # (start, end, text)
+        for event, registration, handler, shortcut, transformer in events:
+            if event in self.registered:
+                span = self.registrations.get(event)
+                if transformer and span and content[span[0]:span[1]] != registration:
+                    replaces.append(span + (registration,))
+                    added['transformers'].append(event)
+                continue
+            registrations.append(registration)
+            added['registrations'].append(event)
+            if event not in self.handlers:
+                handlers.append(handler)
+                added['handlers'].append(event)
+            if shortcut:
+                shortcuts.append(shortcut)
+                added['shortcuts'].append(event)
+        if registrations:  # after the last registration in the constructor body
+            end = self.ctor_close
+            while end > self.ctor_open + 1 and content[end - 1].isspace():
+                end -= 1
+            inserts.append((end, ''.join('\n      %s;' % r for r in registrations)))
+        if shortcuts:
+            short = "\n".join(shortcuts + [""])
+            if self.mark_end > self.mark >= 0:  # right after the last shortcut
+                end = self.mark_end
+                while end > self.mark and content[end - 1].isspace():
+                    end -= 1
+                inserts.append((end, "\n" + short.rstrip('\n')))
+            else:
+                inserts.append((self.ctor_close + 1, "\n\n   %s\n%s\n   %s" % (SHORTCUT_MARK, short,
+                                                                          SHORTCUT_MARK_END)))
+        if handlers:
+            inserts.append((self.class_close, "\n".join(handlers + [""])))
+        if not inserts and not replaces:
+            return content, added
+        chunks = []
+        pos = 0
+        for start, end, text in sorted([(where, where, text) for where, text in inserts] + replaces,
+                                       key=lambda i: i[0]):
+            chunks.append(content[pos:start])
+            chunks.append(text)
+            pos = end
+        chunks.append(content[pos:])
+        return ''.join(chunks), added
+
+
+def generate_hydrate(state_class, debounce=None, persist_on=None):
+    """
+    fromJson/toJson of a HydratedBloc, HydratedBloc writes whatever toJson returns on every state change
+    and nothing when it returns null
+    :param debounce: milliseconds, toJson only schedules a write of the latest state, close() waits for it
+    :param persist_on: fields, the state is only serialized when one of them changed since the last write
+    """
+    ret = compile_template("""
+   @override
+   %state_class? fromJson(Map<String, dynamic> json)=>%state_class.fromJson(json);
+""")(state_class=state_class)
+    if not debounce and not persist_on:
+        return ret + compile_template("""
+   @override
+   Map<String, dynamic>? toJson(%state_class state)=>state.toJson();
+""")(state_class=state_class)
+    unchanged = ''
+    if persist_on:
+        unchanged = compile_template("""
+     final last = _persisted;
+     if (last != null && %same) {  // none of the persisted fields changed since the last write
+       %skip
+     }""")(
+            same=' &&\n         '.join('last.%s == state.%s' % (field, field) for field in persist_on),
+            skip='_pending = null;\n       return null;' if debounce else 'return null;',
+        )
+    if not debounce:
+        return ret + compile_template("""
+   %state_class? _persisted;  // last state written to storage
 
+   @override
+   Map<String, dynamic>? toJson(%state_class state) {%unchanged
+     _persisted = state;
+     return state.toJson();
+   }
+""")(state_class=state_class, unchanged=unchanged)
+    return ret + compile_template("""
+   %state_class? _persisted;  // last state written to storage
+   %state_class? _pending;  // latest state, written once it stopped changing for a while
+   Timer? _persistTimer;
 
-def get_class(content, first=True):
-    if not content:
-        return
-    result = re.findall(r'class\s+(\w+)\s*(?:extends .*?)*\s*{', content)
-    if result and first:
-        return result[0]
-    return result
+   @override
+   Map<String, dynamic>? toJson(%state_class state) {%unchanged
+     _pending = state;
+     _persistTimer?.cancel();
+     _persistTimer = Timer(const Duration(milliseconds: %debounce), _persist);
+     return null;
+   }
+
+   Future<void> _persist() async {
+     _persistTimer?.cancel();
+     _persistTimer = null;
+     final pending = _pending;
+     if (pending == null) return;
+     _pending = null;
+     _persisted = pending;
+     try {
+       await HydratedBloc.storage.write(storageToken, pending.toJson());
+     } catch (error, stackTrace) {  // like HydratedMixin, a failed write goes to onError
+       onError(error, stackTrace);
+     }
+   }
+
+   @override
+   Future<void> close() async {
+     await _persist();
+     await super.close();
+   }
+""")(state_class=state_class, unchanged=unchanged, debounce=debounce)
 
 
-def bloc_gen(args, data=None):
-    global EVENT_SHORTCUT
+def bloc_gen(args, data=None, session=None):
     fields = shared_fields(
         {
             'name': 'BaseBloc',
@@ -303,11 +1289,25 @@ def bloc_gen(args, data=None):
             'event_file': None,
             'repo_file': None,
             T_USEREPLAY: False,  # allow using replay mixins
+            T_HYDRATE: None,
+            T_DEBOUNCE: None,
+            T_PERSIST_ON: None,
         }
     )
-    sync_data(args, fields, data)
+    session = session or Session()
+    sync_data(args, fields, data, session)
     if not args.state_file:
         error("Missing state file")
+    hydrate = args.hydrate or {}
+    if not isinstance(hydrate, dict):
+        error("%s takes %s and/or %s" % (T_HYDRATE, T_DEBOUNCE, T_PERSIST_ON))
+    debounce = args.debounce or hydrate.get(T_DEBOUNCE)
+    debounce = parse_duration(debounce) if debounce else None
+    persist_on = args.persistOn or hydrate.get(T_PERSIST_ON) or []
+    if isinstance(persist_on, str):
+        persist_on = persist_on.split()
+    if (debounce or persist_on) and not args.useHydrate:
+        error("%s and %s need useHydrate" % (T_DEBOUNCE, T_PERSIST_ON))
 
     if not args.event_file:
         error("Missing event file")
@@ -318,13 +1318,20 @@ def bloc_gen(args, data=None):
     dest_file = args.dest
     bloc_class = args.name
     replay_mixins = ' with ReplayBlocMixin' if args.useReplay else ''
+    registration = compile_template('on<%event>(%func%transformer)')
+    handler = compile_template('   Future<void> %func(%event event, Emitter<%state> emit) '
+                               'async {\n   //TODO add your code here\n   }\n')
+    shortcut_func = compile_template('''
+    void %name(%argdef){
+      add(%event(%arg));
+    }''')
 
     def event_handlers(event_name, state):
-        global EVENT_SHORTCUT
         comma = ", "
         func = '_on%s' % event_name
         _short = ""
-        _args = EVENT_SHORTCUT.get(event_name, None)
+        _transformer, _ = session.transformers.get(event_name, ('', ()))
+        _args = session.shortcuts.get(event_name, None)
         if _args:
             _name, _rest = _args
             _argdef = ""
@@ -332,37 +1339,29 @@ def bloc_gen(args, data=None):
             if len(_rest) == 2 and _rest[0]:
                 _argdef = comma.join(_rest[0])
                 _arg = comma.join(_rest[1])
-            _short = DartTemplate('''
-    void %name(%argdef){
-      add(%event(%arg));
-    }''').safe_substitute(
+            _short = shortcut_func(
                 name=_name,
                 argdef='{%s}' % _argdef if _argdef else '',
-                arg=_arg
+                arg=_arg,
+                event=event_name
             )
 
         return [
-            DartTemplate(s).safe_substitute(
-                event=event_name,
-                state=state,
-                func=func
-            )
-            for s in [
-                'on<%event>(%func)',
-                '   Future<void> %func(%event event, Emitter<%state> emit) '
-                'async {\n   //TODO add your code here\n   }\n',
-                _short
-            ]
+            registration(event=event_name, func=func,
+                         transformer=', transformer: %s' % _transformer if _transformer else ''),
+            handler(event=event_name, state=state, func=func),
+            _short,
+            bool(_transformer),
         ]
 
-    state_content = load_content(state_file)
-    event_content = load_content(event_file)
-    repo_content = load_content(repo_file)
-    if repo_file and not repo_content:
+    state_classes = session.classes(state_file)
+    event_classes = session.classes(event_file)
+    repo_classes = session.classes(repo_file)
+    if repo_file and repo_classes is None:
         error("%s doesn't seem to exist" % repo_file)
-    exist_content = load_content(dest_file)
+    exist_content = session.read(dest_file)
 
-    bloc_template = DartTemplate('''
+    bloc_template = compile_template('''
 %part
 class %bloc_class extends %{mixins}Bloc<%event_class, %state_class>%replay_mixins{
    %repo
@@ -373,23 +1372,25 @@ class %bloc_class extends %{mixins}Bloc<%event_class, %state_class>%replay_mixin
 }
 ''')
 
-    shortcut_mark = "/// shortcut functions"
-    shortcut_mark_end = "/// end shortcut"
-
     def add_mark(content):
-        return "%s\n%s\n   %s\n" % (shortcut_mark, content, shortcut_mark_end)
+        return "%s\n%s\n   %s\n" % (SHORTCUT_MARK, content, SHORTCUT_MARK_END)
 
-    if not event_content:
+    if not event_classes:
         error("Wrong content from %s" % event_file)
-    event_base, *event_classes = get_class(event_content, False)
+    event_base, *event_classes = [c['name'] for c in event_classes]
     repo_class = ""
-    if repo_content:
-        repo_class = get_class(repo_content)
-        if not repo_class:
+    if repo_classes is not None:
+        if not repo_classes:
             error("%s is not a valid dart class file?!" % repo_file)
-    state_class = get_class(state_content)
-    if not state_class:
+        repo_class = repo_classes[0]['name']
+    if not state_classes:
         error("Missing right content from %s" % state_file)
+    state_class = state_classes[0]['name']
+    if persist_on and state_classes[0]['extends'] in ('', T_EQUATABLE):  # otherwise fields may be inherited
+        state_fields = {field[2] for field in state_classes[0]['fields']}
+        missing = [field for field in persist_on if field not in state_fields]
+        if missing:
+            error("%s: %s not in %s" % (T_PERSIST_ON, ', '.join(missing), state_class))
     ret = ""
 
     def get_handler_func(events):
@@ -397,7 +1398,7 @@ class %bloc_class extends %{mixins}Bloc<%event_class, %state_class>%replay_mixin
         event_handler = []
         event_short = []
         for event in events:
-            handler, func, short = event_handlers(event, state_class)
+            handler, func, short, _ = event_handlers(event, state_class)
             event_funcs.append(func)
             event_handler.append(handler)
             if short:
@@ -409,93 +1410,61 @@ class %bloc_class extends %{mixins}Bloc<%event_class, %state_class>%replay_mixin
 
         ]
 
-    if exist_content:  # brand new
-        construct_handler_pattern = r'on<(\w+)>\(_on\w+\)'
-        exist_events = re.findall(construct_handler_pattern, exist_content)
-        event_handler_pattern = r' _on(\w+)\('
-        exist_event_funcs = re.findall(event_handler_pattern, exist_content)
-        if exist_events and exist_event_funcs:
-            def search(a):
-                return a not in exist_events
-
-            ret = exist_content
-            missed_events = list(filter(search, event_classes))
-            if missed_events:
-                event_funcs_str, event_handler_str, short_str = get_handler_func(missed_events)
-
-                if event_handler_str:
-                    ret = re.sub(
-                        r'(super.*?{)',
-                        r'\1\n      %s' % event_handler_str.strip(),
-                        exist_content
-                    )
-                if event_funcs_str:
-                    ret = re.sub(
-                        r'(}\s*)$',
-                        r'%s\1' % event_funcs_str,
-                        ret
-                    )
-                if short_str:
-                    hasmark = ret.find(shortcut_mark) > 0
-                    shortpatter = r'(super.*?\{[^}]+\}([\s\S]*toJson\(\);)?)' if not hasmark else r'(%s\n)' % (
-                        shortcut_mark)
-                    ret = re.sub(
-                        shortpatter,
-                        r'\1\n\n    %s' % (add_mark(short_str) if not hasmark else short_str),
-                        ret
-                    )
+    if exist_content:  # merge the missing events into it
+        with PROFILE.phase('bloc merge'):
+            merger = BlocMerger(exist_content)
+            if merger.valid:
+                ret, added = merger.merge([
+                    [event] + event_handlers(event, state_class) for event in event_classes
+                ])
+        if merger.valid:
+            if added['registrations']:
+                session.note("%s: added %d handler(s) %s, %d handler method(s), %d shortcut(s)" % (
+                    dest_file, len(added['registrations']), ', '.join(added['registrations']),
+                    len(added['handlers']), len(added['shortcuts'])))
+            if added['transformers']:
+                session.note("%s: changed the transformer of %s" % (dest_file, ', '.join(added['transformers'])))
 
     if not ret:
-        repo_var = ""
-        repo_def = ""
-        if repo_class:
-            repo_var = repo_class[0].lower() + repo_class[1:]
-            repo_def = '%s %s;' % (repo_class, repo_var)
-            repo_var = '{required this.%s}' % repo_var
-        event_funcs_str, event_handler_str, shortcut = get_handler_func(event_classes)
-        if shortcut:
-            shortcut = add_mark(shortcut)
-        constructor = DartTemplate('''
+        with PROFILE.phase('render'):
+            repo_var = ""
+            repo_def = ""
+            if repo_class:
+                repo_var = repo_class[0].lower() + repo_class[1:]
+                repo_def = '%s %s;' % (repo_class, repo_var)
+                repo_var = '{required this.%s}' % repo_var
+            event_funcs_str, event_handler_str, shortcut = get_handler_func(event_classes)
+            if shortcut:
+                shortcut = add_mark(shortcut)
+            constructor = compile_template('''
     %bloc_class(%repo_var) : super(const %state_class()) {
       %event_handlers
     }
-''').safe_substitute(
-            bloc_class=bloc_class,
-            state_class=state_class,
-            event_handlers=event_handler_str,
-            repo_var=repo_var
-        )
-        ret = bloc_template.safe_substitute(
-            bloc_class=bloc_class,
-            state_class=state_class,
-            constructor=constructor,
-            event_class=event_base,
-            shortcut=shortcut,
-            repo=repo_def,
-            event_handler=event_funcs_str,
-            part="part of '%s';\n" % args.part if args.part else '',
-            # mixins=" with HydratedMixin" if args.useHydrate else "",
-            mixins="Hydrated" if args.useHydrate else "",
-            replay_mixins=replay_mixins,
-            hydrate=DartTemplate("""
-   @override
-   %state_class? fromJson(Map<String, dynamic> json)=>%state_class.fromJson(json);
-
-   @override
-   Map<String, dynamic>? toJson(%state_class state)=>state.toJson();
-""").safe_substitute(
-                state_class=state_class
-            ) if args.useHydrate else "",
-        )
-    write_content(args.dest, ret, args.overwrite)
+''')(
+                bloc_class=bloc_class,
+                state_class=state_class,
+                event_handlers=event_handler_str,
+                repo_var=repo_var
+            )
+            ret = bloc_template(
+                bloc_class=bloc_class,
+                state_class=state_class,
+                constructor=constructor,
+                event_class=event_base,
+                shortcut=shortcut,
+                repo=repo_def,
+                event_handler=event_funcs_str,
+                part="part of '%s';\n" % args.part if args.part else '',
+                # mixins=" with HydratedMixin" if args.useHydrate else "",
+                mixins="Hydrated" if args.useHydrate else "",
+                replay_mixins=replay_mixins,
+                hydrate=generate_hydrate(state_class, debounce, persist_on) if args.useHydrate else "",
+            )
+    session.write(args.dest, ret, args.overwrite)
     return ret
 
 
-EVENT_SHORTCUT = {}
-
-
-def event_gen(args, data=None):
-    global EVENT_SHORTCUT  # store event shortcut -> [eventname, arguments]
+def event_gen(args, data=None, session=None):
     fields = shared_fields({
         'name': 'BaseEvent',
         T_USEREPLAY: False,  # allow using replay mixins
@@ -503,7 +1472,8 @@ def event_gen(args, data=None):
     }
     )
 
-    sync_data(args, fields, data)
+    session = session or Session()
+    sync_data(args, fields, data, session)
     vs = {}
     events = args.events
     DELI = '#'
@@ -513,81 +1483,100 @@ def event_gen(args, data=None):
     def convert_to_var(inp):
         return Vars(inp)
 
-    if isinstance(events, dict):  # from YAML file
-        for k, vv in events.items():
-            if not vv:
-                vs[k] = []
-            else:
-                for v in vv:
-                    vs.setdefault(k, []).append(convert_to_var(v))
-    else:
-        for v in args.events:
-            parts = v.split(DELI)
-            if len(parts) == 2:  # it contains event name
-                eventname = parts[0]
-                v = parts[1]
-            vs.setdefault(eventname, []).append(convert_to_var(v))
+    with PROFILE.phase('prop parsing'):
+        if isinstance(events, dict):  # from YAML file
+            for k, vv in events.items():
+                if isinstance(vv, dict):  # {transformer: restartable, props: [...]}, or debounce/throttle: 300ms
+                    for key in (T_DEBOUNCE, T_THROTTLE):
+                        if vv.get(key):
+                            vv = dict(vv, **{T_TRANSFORMER: '%s:%s' % (key, vv[key])})
+                    if vv.get(T_TRANSFORMER):
+                        k = '%s@%s' % (k, vv[T_TRANSFORMER])
+                    vv = vv.get(T_PROPS)
+                if not vv:
+                    vs[k] = []
+                else:
+                    for v in vv:
+                        vs.setdefault(k, []).append(convert_to_var(v))
+        else:
+            for v in args.events:
+                parts = v.split(DELI)
+                if len(parts) == 2:  # it contains event name
+                    eventname = parts[0]
+                    v = parts[1]
+                vs.setdefault(eventname, []).append(convert_to_var(v))
+    PROFILE.count('events', len(vs))
+    PROFILE.count('props', sum(len(v) for v in vs.values()))
 
     basename = args.name
-    ret = "sealed class %s%s {}\n\n" % (basename, replay_event)
-    event_template = '''class %event_name extends %base_name {
+    chunks = ["sealed class %s%s {}\n\n" % (basename, replay_event)]
+    event_template = compile_template('''class %event_name extends %base_name {
     %extra
 }    
-'''
-
-    for en, eps in vs.items():
-        extra = ""
-        final = []
-        const = []
-        shortcut = ""
-        if en.find('~') > 1:  # has shortcut name
-            pattern = r'^(.+)~(.*)$'
-            result = re.findall(pattern, en)
-            if result:
-                en = result[0][0]
-                shortcut = result[0][1]
-        if en.startswith("."):  # append to basename
-            en = basename + en[1:]
-        elif en.startswith("%"):  # prepend to basename
-            en = en[1:] + basename
-        sargs = None
-        if shortcut:
-            sargs = [[], []]  # first is the argdef, second is arg
-            EVENT_SHORTCUT[en] = [shortcut, sargs]
-        if len(eps) > 0:  # extra arguments needed
-            for v in eps:
-                if shortcut:
-                    sargs[0].append('%s%s %s%s' % (
-                        '' if (v.value and v.value.strip()) or v.optional else 'required ',
-                        v.clsname, v.name, v.value
-                    ))
-                    sargs[1].append('%s: %s' % (v.name, v.name))
-                final.append('%s\n  final %s %s' % (v.comment, v.clsname, v.name))
-                const.append(
-                    '%s this.%s%s' % (
-                        '' if (v.value and v.value.strip()) or v.optional else 'required', v.name,
-                        v.value))
-            extra = DartTemplate('''
+''')
+    extra_template = compile_template('''
   %final;
   %clsname({%const});
-''').safe_substitute(
-                clsname=en,
-                final=';\n  '.join(final),
-                const=', '.join(const),
-            )
-        kargs = {
-            "base_name": basename,
-            "event_name": en,
-            "extra": extra,
-        }
-        ret += DartTemplate(event_template).safe_substitute(**kargs)
-    if args.part:
-        ret = '%s\n%s' % ("part of '%s';" % args.part, ret)
-    write_content(args.dest, ret, args.overwrite)
+''')
+
+    with PROFILE.phase('render'):
+        for en, eps in vs.items():
+            extra = ""
+            final = []
+            const = []
+            shortcut = ""
+            transformer = None
+            if '@' in en:  # Event~shortcut@restartable
+                en, transformer = en.split('@', 1)
+            if en.find('~') > 1:  # has shortcut name
+                pattern = r'^(.+)~(.*)$'
+                PROFILE.count('regex evaluations')
+                result = re.findall(pattern, en)
+                if result:
+                    en = result[0][0]
+                    shortcut = result[0][1]
+            if en.startswith("."):  # append to basename
+                en = basename + en[1:]
+            elif en.startswith("%"):  # prepend to basename
+                en = en[1:] + basename
+            sargs = None
+            if shortcut:
+                sargs = [[], []]  # first is the argdef, second is arg
+                session.shortcuts[en] = [shortcut, sargs]  # for bloc_gen
+            if transformer:
+                session.transformers[en] = parse_transformer(en, transformer)
+            if len(eps) > 0:  # extra arguments needed
+                for v in eps:
+                    if shortcut:
+                        sargs[0].append('%s%s %s%s' % (
+                            '' if (v.value and v.value.strip()) or v.optional else 'required ',
+                            v.clsname, v.name, v.value
+                        ))
+                        sargs[1].append('%s: %s' % (v.name, v.name))
+                    final.append('%s\n  final %s %s' % (v.comment, v.clsname, v.name))
+                    const.append(
+                        '%s this.%s%s' % (
+                            '' if (v.value and v.value.strip()) or v.optional else 'required', v.name,
+                            v.value))
+                extra = extra_template(
+                    clsname=en,
+                    final=';\n  '.join(final),
+                    const=', '.join(const),
+                )
+            kargs = {
+                "base_name": basename,
+                "event_name": en,
+                "extra": extra,
+            }
+            chunks.append(event_template(**kargs))
+        if args.part:
+            chunks.insert(0, "part of '%s';\n" % args.part)
+        ret = ''.join(chunks)
+    session.write(args.dest, ret, args.overwrite)
     return ret
 
 
-def get_code(data, fullname):
+def get_code(data, fullname, session):
     def rel(where):
         return os.path.relpath(where, os.path.dirname(fullname))
 
@@ -599,14 +1588,18 @@ def get_code(data, fullname):
         partfile = '%s.c.dart' % part
         code = "part '%s';" % partfile
         partwhere = os.path.join(os.path.dirname(fullname), partfile)
-        if not os.path.exists(partwhere):
-            write_content(partwhere, "part of '%s.dart';" % part)
+        if not session.exists(partwhere):
+            session.write(partwhere, "part of '%s.dart';" % part)
     return code
 
 
-def all_gen(args, data=None):
+def all_gen(args, data=None, only=None, session=None):
+    """
+    :param only: processors to run, the others just prepare their file names, default to all of them
+    """
     if not data:
         data = {}
+    session = session or Session()
     processors = [T_STATE, T_EVENT, T_BLOC]
     PART = T_PART
     PATH = T_PATH
@@ -617,7 +1610,7 @@ def all_gen(args, data=None):
         error("%s is mandatory argument in your YAML file" % PART)
 
     def get_fullname(dest, mypart=part):
-        return os.path.realpath(os.path.join(os.path.dirname(dest), mypart))
+        return session.path(os.path.join(os.path.dirname(dest), mypart))
 
     def get_rel(where, full_name):
         return os.path.relpath(where, os.path.dirname(full_name))
@@ -635,14 +1628,17 @@ def all_gen(args, data=None):
         sub = data[T_EVENT] or {}
         sub[T_USEREPLAY] = use_replay
     state_data = data.get(T_STATE, {})
+    equal = False
     need_part = state_data.get('useJson', None) or data.get(T_BLOC,{}).get('useHydrate', None)
+    if state_data.get('useJson', None) == JSON_INLINE:  # nothing for json_serializable to generate
+        need_part = False
     if state_data:
      if T_PARENT in state_data:  # has parent
         parent_file = state_data.get(T_PARENT, '')
         dest = state_data.get(T_DEST, data.get(T_BLOC, {}).get(T_DEST, ''))
         fullname = get_fullname(path + os.path.sep, dest)
         real_file = get_fullname(fullname, parent_file)
-        if os.path.exists(real_file):
+        if session.exists(real_file):
             state_data[T_PARENT] = real_file
         else:
             error("%s specified, but %s's content is not there"%(T_PARENT, parent_file))
@@ -650,8 +1646,6 @@ def all_gen(args, data=None):
      equal = True  # default to use equal
      if T_EQUAL in state_data:  # use equal
         equal = state_data.get(T_EQUAL, None)
-     if equal:
-        importcode = "import '%s';\n%s" % ('package:equatable/equatable.dart', importcode)
     for processor in processors:
         subdata = data.get(processor, {})
         if not subdata:
@@ -674,11 +1668,20 @@ def all_gen(args, data=None):
             event_file = 'event_file'
             subdata[state_file] = subdata.get(state_file, getattr(prepare[T_STATE], T_DEST, None))
             subdata[event_file] = subdata.get(event_file, getattr(prepare[T_EVENT], T_DEST, None))
-        result[processor] = func(namespace, subdata)
-
+        if only is not None and processor not in only:
+            sync_data(namespace, shared_fields(dict.fromkeys(subdata)), subdata, session)
+            continue
+        result[processor] = func(namespace, subdata, session)
+
+    # what the states extend or compare with, known once state_gen ran
+    generated = getattr(prepare.get(T_STATE), T_EQUALITY, None) == EQ_GENERATED
+    if equal and not generated:
+        importcode = "import '%s';\n%s" % ('package:equatable/equatable.dart', importcode)
+    if equal and getattr(prepare.get(T_STATE), 'deepEquality', generated):
+        importcode = "import '%s';\n%s" % (COLLECTION_IMPORT, importcode)
     if state_only or event_only:
         KEY = T_STATE if state_only else T_EVENT
-        ret = result[KEY]
+        ret = result.get(KEY)
         args = prepare[KEY]
         if part:
             fullname = get_fullname(args.dest)
@@ -686,11 +1689,11 @@ def all_gen(args, data=None):
             def rel(where):
                 return get_rel(where, fullname)
 
-            if not os.path.exists(fullname):
+            if not session.exists(fullname):
                 name = os.path.basename(fullname)
                 part, _ = os.path.splitext(name)
                 part_g = "part '%s.g.dart';" % part if need_part else ''
-                code = get_code(data, fullname)
+                code = get_code(data, fullname, session)
                 statename = rel(getattr(prepare[KEY], T_DEST))
                 template = '''
 %extra_import
@@ -708,7 +1711,7 @@ part '%state';
 
 %code
 '''
-                write_content(fullname, DartTemplate(template).safe_substitute(
+                session.write(fullname, compile_template(template)(
                     extra_import=importcode,
                     part_g=part_g,
                     part=part,
@@ -718,7 +1721,7 @@ part '%state';
             )
         return ret
     args = prepare[T_BLOC]
-    ret = result[T_BLOC]
+    ret = result.get(T_BLOC)
     if args.part:  # it's part of a state file
         fullname = get_fullname(args.dest, args.part)
 
@@ -729,22 +1732,28 @@ part '%state';
         statename = rel(getattr(prepare[T_STATE], T_DEST))
         eventname = rel(getattr(prepare[T_EVENT], T_DEST))
         repo_file = getattr(prepare[T_BLOC], 'repo_file', '')
-        if not os.path.exists(fullname):
-            print("%s is not there, we will create it" % fullname)
+        # what the event transformers need
+        transformer_imports = sorted({i for _, imports in session.transformers.values() for i in imports})
+        if not session.exists(fullname):
+            session.note("%s is not there, we will create it" % fullname)
             name = os.path.basename(fullname)
             part, _ = os.path.splitext(name)
             part_g = "part '%s.g.dart';" % part if need_part else ''
-            code = get_code(data, fullname)
+            code = get_code(data, fullname, session)
             bloc_import = 'hydrated_bloc/hydrated_bloc.dart' if getattr(prepare[T_BLOC],
                                                                         'useHydrate', True) \
                 else 'bloc/bloc.dart'
             if getattr(prepare[T_BLOC], T_USEREPLAY, True):
                 importcode += "\nimport 'package:replay_bloc/replay_bloc.dart';"
-            write_content(fullname, DartTemplate('''
+            if getattr(prepare[T_BLOC], T_DEBOUNCE, None) or \
+                    (getattr(prepare[T_BLOC], T_HYDRATE, None) or {}).get(T_DEBOUNCE):  # the Timer of the writes
+                importcode = "import 'dart:async';\n%s" % importcode
+            for transformer_import in transformer_imports:
+                importcode += "\nimport '%s';" % transformer_import
+            session.write(fullname, compile_template('''
 %extra_import
 
-import 'package:%bloc_import';
-import 'package:equatable/equatable.dart';
+import 'package:%bloc_import';%equatable
 import 'package:json_annotation/json_annotation.dart';
 
 %repo_file
@@ -755,7 +1764,7 @@ part '%event';
 part '%bloc';
 
 %code
-''').safe_substitute(
+''')(
                 extra_import=importcode,
                 repo_file="import '%s';" % rel(repo_file) if repo_file else "",
                 part_g=part_g,
@@ -764,12 +1773,412 @@ part '%bloc';
                 event=eventname,
                 bloc=blocname,
                 code=code,
-                bloc_import=bloc_import
+                bloc_import=bloc_import,
+                equatable='' if generated else "\nimport 'package:equatable/equatable.dart';",
             )
-                          )
+                         )
+        else:
+            library = session.read(fullname) or ''
+            missing = [i for i in transformer_imports if "'%s'" % i not in library]
+            if missing:
+                session.note("%s: add %s for the event transformers" % (
+                    fullname, ' '.join("import '%s';" % i for i in missing)))
     return ret
 
 
+def file_hash(name):
+    if not os.path.isfile(name):
+        return None
+    with open(name, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+GEN_VERSION = file_hash(os.path.realpath(__file__))  # any change to the generator invalidates all builds
+
+
+class BuildDB:
+    """
+    Remember the content hash of every file a YAML build depends on: the YAML itself, parent class,
+    state/event/repo files, the existing bloc file and the generator version.
+    A YAML only needs to be regenerated when one of them changed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.dirty = False
+        self.builds = {}
+        if os.path.isfile(path):
+            try:
+                with open(path) as f:
+                    self.builds = json.load(f).get('builds', {})
+            except (ValueError, AttributeError):
+                print("%s is corrupted, rebuild everything" % path, file=sys.stderr)
+
+    def is_valid(self, yaml_file):
+        build = self.builds.get(os.path.realpath(yaml_file))
+        if not build or build.get('version') != GEN_VERSION:
+            return False
+        return all(file_hash(name) == digest for name, digest in build.get('inputs', {}).items())
+
+    def record(self, yaml_file, inputs=()):
+        yaml_file = os.path.realpath(yaml_file)
+        self.builds[yaml_file] = {
+            'version': GEN_VERSION,
+            'inputs': {name: file_hash(name) for name in sorted(set(inputs) | {yaml_file})}
+        }
+        self.dirty = True
+
+    def forget(self, yaml_file):
+        if self.builds.pop(os.path.realpath(yaml_file), None):
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = '%s.%d' % (self.path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump({'version': GEN_VERSION, 'builds': self.builds}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+def cache_path(args, where, name):
+    return os.path.join(getattr(args, 'cache_dir', None) or os.path.join(where, T_CACHE_DIR), name)
+
+
+def build_db(args, where):
+    return BuildDB(cache_path(args, where, BUILD_DB))
+
+
+def incremental_gen(args, data=None, session=None):
+    """
+    all_gen, but only when the YAML's inputs changed since the last successful build
+    """
+    yaml_file = os.path.realpath(args.YAML)
+    db = build_db(args, os.path.dirname(yaml_file))
+    if not args.force and db.is_valid(yaml_file):  # its .g.dart files may still be missing or stale
+        save_targets(getattr(args, 'changed_list', None), build_targets(db.builds[yaml_file]['inputs']))
+        return "%s build is still valid" % args.YAML
+    db.forget(yaml_file)  # don't trust the old record if we fail half way
+    db.save()
+    session = session or Session()
+    session.index = DartIndex(cache_path(args, os.path.dirname(yaml_file), DART_INDEX_FILE))
+    PROFILE.yaml = yaml_file
+    ret = all_gen(args, data, session=session)
+    stats = flush(session)
+    session.index.save()
+    save_targets(getattr(args, 'changed_list', None), build_targets(session.files, session.written, args.force))
+    db.record(yaml_file, session.files)
+    db.save()
+    print(write_summary(stats), file=sys.stderr)
+    return ret
+
+
+def config_data(data):
+    if isinstance(data, dict) and (T_BLOC not in data) and (T_STATE not in data):  # it's a event only
+        data['eventOnly'] = True
+    return data
+
+
+def load_cache(path, digest):
+    """:return: what save_cache() saved for the same digest and generator version, None if there isn't"""
+    if not path or not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            cached = pickle.load(f)
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError):
+        return None
+    if cached.get('hash') != digest or cached.get('version') != GEN_VERSION:
+        return None
+    PROFILE.count('cache hits')
+    return cached['data']
+
+
+def save_cache(path, digest, data):
+    if not path:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = '%s.%d' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        pickle.dump({'hash': digest, 'version': GEN_VERSION, 'data': data}, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def load_yaml(name, cache_dir=None):
+    """
+    :param cache_dir: where to keep the parsed content, keyed by the YAML's content hash,
+        so an unchanged YAML is never parsed again
+    """
+    with open(name, 'rb') as f:
+        raw = f.read()
+    PROFILE.count('files read')
+    digest = hashlib.sha1(raw).hexdigest()
+    cache = cache_dir and os.path.join(cache_dir, '%s.pickle' % hashlib.sha1(
+        os.path.realpath(name).encode()).hexdigest())
+    data = load_cache(cache, digest)
+    if data is None:
+        with PROFILE.phase('yaml load'):
+            data = config_data(yaml.load(raw, Loader=YAML_LOADER) or {})
+        save_cache(cache, digest, data)
+    return data
+
+
+def is_bloc_yaml(data):
+    return isinstance(data, dict) and T_PART in data and \
+        any(data.get(k) for k in (T_STATE, T_EVENT, T_BLOC))
+
+
+def find_yamls(root):
+    found = []
+    for where, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.') and d not in SKIP_DIRS)
+        for name in sorted(files):
+            if name.endswith(YAML_EXTS) and name != 'pubspec.yaml':
+                found.append(os.path.join(where, name))
+    return found
+
+
+WORKER_INDEX = None  # dart index of a project worker process, kept between the YAML files it generates
+
+
+def project_job(yaml_file, index=None, cache_dir=None, force=False):
+    """
+    generate one YAML file, it's executed in a worker process
+    :return: (yaml_file, status, output, seconds, inputs, write stats, dart index updates, profile,
+        .g.dart files to regenerate), status is None if it's not a bloc YAML
+    """
+    start = time.time()
+    out = io.StringIO()
+    status = False
+    stats = {}
+    session = Session(os.path.dirname(yaml_file), index or WORKER_INDEX)
+    PROFILE.yaml = yaml_file
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+            data = load_yaml(yaml_file, cache_dir)
+            if is_bloc_yaml(data):
+                all_gen(argparse.Namespace(YAML=yaml_file), data=data, session=session)
+                stats = flush(session)
+                status = True
+            else:
+                status = None
+    except GenError as e:
+        out.write('%s\n' % e)
+    except Exception as e:
+        out.write('%s: %s\n' % (type(e).__name__, e))
+    updates, session.index.updates = session.index.updates, {}
+    return (yaml_file, status, out.getvalue(), time.time() - start, sorted(session.files), stats,
+            updates, PROFILE.take(), build_targets(session.files, session.written, force))
+
+
+def project_init(index_path, profile):
+    """set up a worker process"""
+    global WORKER_INDEX
+    WORKER_INDEX = DartIndex(index_path)
+    PROFILE.enabled = profile
+
+
+def project_gen(args, data=None, session=None):
+    root = os.path.realpath(args.YAML)
+    if not os.path.isdir(root):
+        error("%s is not a directory" % args.YAML)
+    jobs = args.jobs or os.cpu_count() or 1
+    db = build_db(args, root)
+    yamls = find_yamls(root)
+    valid = [y for y in yamls if not args.force and db.is_valid(y)]
+    yamls = [y for y in yamls if y not in valid]
+    start = time.time()
+    index = DartIndex(cache_path(args, root, DART_INDEX_FILE))
+    configs = cache_path(args, root, CONFIG_CACHE)
+    if jobs > 1 and len(yamls) > 1:  # workers load the index once, we merge what they scanned
+        with ProcessPoolExecutor(max_workers=min(jobs, len(yamls)), initializer=project_init,
+                                 initargs=(index.path, PROFILE.enabled)) as pool:
+            results = list(pool.map(functools.partial(project_job, cache_dir=configs, force=args.force), yamls))
+    else:
+        results = [project_job(y, index, configs, args.force) for y in yamls]
+    done = [r for r in results if r[1]]
+    failed = [r for r in results if r[1] is False]
+    stats = dict.fromkeys(STAT_KEYS, 0)
+    targets = set()
+    for yaml_file in valid:  # their .g.dart files may still be missing or stale
+        targets.update(build_targets(db.builds[os.path.realpath(yaml_file)]['inputs']))
+    for yaml_file, status, output, seconds, inputs, written, updates, profile, changed in results:
+        for key, value in written.items():
+            stats[key] += value
+        targets.update(changed)
+        index.merge(updates)
+        PROFILE.merge(profile)
+        if status is False:
+            db.forget(yaml_file)
+            print("FAILED %s (%.2fs)\n%s" % (os.path.relpath(yaml_file, root), seconds, output.strip()),
+                  file=sys.stderr)
+        else:  # ignored YAML files are recorded as well, so we don't load them again next time
+            db.record(yaml_file, inputs)
+    db.save()
+    index.save()
+    save_targets(args.changed_list, sorted(targets))
+    summary = "%d bloc YAML(s) generated, %d still valid, %d failed, %d ignored under %s in %.2fs with %d worker(s)" % (
+        len(done), len(valid), len(failed), len(results) - len(done) - len(failed), root,
+        time.time() - start, jobs)
+    summary += "\n" + write_summary(stats)
+    if failed:
+        error(summary)
+    return summary
+
+
+def build_parser(parser):
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='Regenerate even if none of the inputs changed since the last build')
+    parser.add_argument('--cache_dir',
+                        help='Where to keep the build database, default to %s next to the YAML file '
+                             'or under the project root' % T_CACHE_DIR)
+    parser.add_argument('--changed_list',
+                        help='Append the .g.dart files build_runner has to regenerate, after what this run '
+                             'wrote, to this file. They are relative to the package (where pubspec.yaml is)')
+    profile_parser(parser)
+
+
+class Watcher:
+    """
+    Stay resident, poll the bloc YAML files and every file they depend on,
+    and only rerun the generators affected by a change.
+    Parsed YAML files are kept in memory between runs.
+    """
+
+    def __init__(self, root, db, index, interval=0.5, force=False, configs=None):
+        self.root = root
+        self.db = db
+        self.index = index  # scanned classes stay in memory as well
+        self.configs_dir = configs
+        self.interval = interval
+        self.force = force
+        self.configs = {}  # YAML -> parsed content
+        self.deps = {}  # YAML -> {file: processors to rerun once it changes}
+        self.stats = {}  # file -> (mtime, size)
+
+    @staticmethod
+    def stat(name):
+        try:
+            st = os.stat(name)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def affected(self, old, new):
+        """which processors need to rerun after the YAML changed from old to new"""
+        if old is None or {k: v for k, v in old.items() if k not in (T_STATE, T_EVENT, T_BLOC)} != \
+                {k: v for k, v in new.items() if k not in (T_STATE, T_EVENT, T_BLOC)}:
+            return None  # shared settings changed, rerun them all
+        only = set()
+        if old.get(T_STATE) != new.get(T_STATE):
+            only.add(T_STATE)
+        if old.get(T_EVENT) != new.get(T_EVENT) or old.get(T_BLOC) != new.get(T_BLOC):
+            only.update([T_EVENT, T_BLOC])  # bloc needs the shortcuts from event
+        return only
+
+    def generate(self, yaml_file, only=None):
+        data = self.configs[yaml_file]
+        start = time.time()
+        session = Session(os.path.dirname(yaml_file), self.index)
+        work = copy.deepcopy(data)  # all_gen changes the data it's given
+        PROFILE.yaml = yaml_file
+        try:
+            all_gen(argparse.Namespace(YAML=yaml_file), data=work, only=only, session=session)
+        except GenError as e:
+            self.db.forget(yaml_file)
+            print("%s failed: %s, waiting for the next change" % (yaml_file, e), file=sys.stderr)
+            return
+        stats = flush(session)
+        parent = work.get(T_STATE, {}).get(T_PARENT)
+        deps = self.deps.get(yaml_file, {}) if only is not None else {}  # a partial run only saw some of them
+        deps.update({name: ({T_STATE} if name == parent else {T_EVENT, T_BLOC}) for name in session.files})
+        self.deps[yaml_file] = deps
+        self.db.record(yaml_file, deps)
+        self.db.save()
+        self.index.save()
+        for name in session.files:  # don't trigger on what we just wrote
+            self.stats[name] = self.stat(name)
+        print("[%s] %s: %s regenerated in %.2fs, %s" % (
+            time.strftime('%H:%M:%S'), os.path.relpath(yaml_file, self.root),
+            '/'.join(p for p in (T_STATE, T_EVENT, T_BLOC) if only is None or p in only) or 'nothing',
+            time.time() - start, write_summary(stats)))
+
+    def scan(self):
+        """find new or changed YAML files"""
+        changed = {}
+        for yaml_file in find_yamls(self.root):
+            st = self.stat(yaml_file)
+            if yaml_file in self.stats and self.stats[yaml_file] == st:
+                continue
+            self.stats[yaml_file] = st
+            try:
+                data = load_yaml(yaml_file, self.configs_dir)
+            except yaml.YAMLError as e:
+                print("%s: %s" % (yaml_file, e), file=sys.stderr)
+                continue
+            old = self.configs.get(yaml_file)
+            if not is_bloc_yaml(data) or data == old:
+                continue
+            self.configs[yaml_file] = data
+            changed[yaml_file] = self.affected(old, data)
+        return changed
+
+    def poll(self):
+        changed = self.scan()
+        for yaml_file, deps in self.deps.items():
+            if yaml_file in changed and changed[yaml_file] is None:
+                continue
+            for name, processors in deps.items():
+                st = self.stat(name)
+                if self.stats.get(name) != st:
+                    self.stats[name] = st
+                    only = changed.setdefault(yaml_file, set())
+                    if only is not None:
+                        only.update(processors)
+        return changed
+
+    def run(self):
+        print("Watching %s, press Ctrl-C to stop" % self.root)
+        first = True
+        try:
+            while True:
+                for yaml_file, only in self.poll().items():
+                    if first and not self.force and self.db.is_valid(yaml_file):  # still valid
+                        self.deps[yaml_file] = {name: {T_STATE, T_EVENT, T_BLOC} for name in
+                                                self.db.builds[yaml_file]['inputs']}
+                        for name in self.deps[yaml_file]:
+                            self.stats.setdefault(name, self.stat(name))
+                        continue
+                    self.generate(yaml_file, only)
+                first = False
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            pass
+
+
+def watch_gen(args, data=None, session=None):
+    root = os.path.realpath(args.YAML)
+    if not os.path.isdir(root):
+        error("%s is not a directory" % args.YAML)
+    Watcher(root, build_db(args, root), DartIndex(cache_path(args, root, DART_INDEX_FILE)), args.interval,
+            args.force, cache_path(args, root, CONFIG_CACHE)).run()
+    return "Stop watching %s" % root
+
+
+def watch_parser(parser):
+    parser.add_argument('-i', '--interval', type=float, default=0.5,
+                        help='How many seconds to wait between polling file changes')
+    build_parser(parser)
+
+
+def project_parser(parser):
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help='How many worker processes to use, default to the number of CPUs')
+    build_parser(parser)
+
+
 def main():
     parser = argparse.ArgumentParser()
     subparsers = parser.add_subparsers(title='subcommands',
@@ -777,7 +2186,8 @@ def main():
                                        description='valid subcommands',
                                        help='List of additional subcommands')
     All = subparsers.add_parser(T_ALL)
-    All.set_defaults(func=all_gen)
+    build_parser(All)
+    All.set_defaults(func=incremental_gen)
     state = subparsers.add_parser(T_STATE)
     state_parser(state)
     state.set_defaults(func=state_gen)
@@ -787,17 +2197,32 @@ def main():
     event = subparsers.add_parser(T_EVENT)
     event_parser(event)
     event.set_defaults(func=event_gen)
-    parser.add_argument('YAML', help='YAML configuration file')
+    project = subparsers.add_parser(T_PROJECT)
+    project_parser(project)
+    project.set_defaults(func=project_gen)
+    watch = subparsers.add_parser(T_WATCH)
+    watch_parser(watch)
+    watch.set_defaults(func=watch_gen)
+    parser.add_argument('YAML', help='YAML configuration file, or the root folder for %s/%s' % (
+        T_PROJECT, T_WATCH))
     args = parser.parse_args()
+    PROFILE.enabled = bool(args.profile)
     data = {}
-    if args.YAML and os.path.exists(args.YAML):
-        with open(args.YAML, 'r') as f:
-            data = yaml.safe_load(f)
-        if (T_BLOC not in data) and (T_STATE not in data): # it's a event only
-            data['eventOnly'] = True
-    return args.func(args, data=data.get(args.subcommand, data))
+    session = Session()
+    try:
+        if args.YAML and os.path.isfile(args.YAML):
+            data = load_yaml(args.YAML, cache_path(args, os.path.dirname(os.path.realpath(args.YAML)),
+                                                   CONFIG_CACHE) if args.subcommand == T_ALL else None)
+        ret = args.func(args, data=data.get(args.subcommand, data), session=session)
+        flush(session)
+        return ret
+    except GenError as e:
+        print(e, file=sys.stderr)
+        sys.exit(-1)
+    finally:
+        if args.profile:
+            PROFILE.save(args.profile, args.profile_format)
 
 
 if __name__ == '__main__':
     print(main())
-    print(EVENT_SHORTCUT)
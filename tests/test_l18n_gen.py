@@ -0,0 +1,47 @@
+import importlib.util
+import os
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def load_l18n_gen():
+    spec = importlib.util.spec_from_file_location('l18n_gen', os.path.join(ROOT, 'i18n', 'l18n_gen.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+l18n_gen = load_l18n_gen()
+
+
+class PlaceholderTest(unittest.TestCase):
+    def test_dollar_arg_interpolates_next_to_placeholders(self):
+        used = set()
+        self.assertEqual(l18n_gen.compile_placeholders('Hello $name {name} %s', ['name'], used),
+                         'Hello ${name} ${name} ${name}')
+        self.assertEqual(used, {'name'})
+
+    def test_literal_dollar_is_escaped(self):
+        self.assertEqual(l18n_gen.compile_placeholders('Hi {name}, $money', ['name']), r'Hi ${name}, \$money')
+        self.assertEqual(l18n_gen.used_args('Hi {name}, $money', ['name', 'amount']), {'name'})
+
+    def test_dart_expression_is_kept(self):
+        self.assertEqual(l18n_gen.compile_placeholders('${name.length} chars', ['name']), '${name.length} chars')
+
+    def test_warnings_are_diagnostics(self):
+        catalog = {
+            'Languages': [{'locale': 'en_US', 'name': 'English', 'default': True},
+                          {'locale': 'fr_FR', 'name': 'French'}],
+            'Strings': {'Hello_name': ['Hello {name}', 'Bonjour']},
+        }
+        diagnostics = []
+        outputs = l18n_gen.build(catalog, 'strings.yaml', 'lib/i18n', 'S', 'TI', 'R', False,
+                                 DIAGNOSTICS=diagnostics)
+        self.assertTrue(outputs)
+        self.assertEqual(len(diagnostics), 1)
+        self.assertIn('Hello_name', diagnostics[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
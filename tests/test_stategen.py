@@ -0,0 +1,36 @@
+import argparse
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+import stategen  # noqa: E402
+
+
+class GeneratedEqualityTest(unittest.TestCase):
+    def state(self, root):
+        session = stategen.Session(root)
+        args = argparse.Namespace(name='Foo', part='x.dart', dest=None, equality=stategen.EQ_GENERATED, equal=True,
+                                  props=['List<int> a'])
+        ret = stategen.state_gen(args, session=session)
+        return ret, session
+
+    def test_no_dest(self):
+        with tempfile.TemporaryDirectory() as root:
+            ret, session = self.state(root)
+            self.assertIn('DeepCollectionEquality', ret)
+            self.assertEqual(session.diagnostics, [])
+
+    def test_no_dest_library_misses_collection(self):
+        with tempfile.TemporaryDirectory() as root:
+            with open(os.path.join(root, 'x.dart'), 'w') as f:
+                f.write("import 'package:bloc/bloc.dart';\n")
+            _, session = self.state(root)
+            self.assertEqual(len(session.diagnostics), 1)
+            self.assertIn(stategen.COLLECTION_IMPORT, session.diagnostics[0])
+
+
+if __name__ == '__main__':
+    unittest.main()